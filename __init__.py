@@ -1,111 +1,54 @@
+import os
 import pygame as pg
 import numpy as np
 import dearpygui.dearpygui as dpg
 import random
 from ui import create_ui, render_ui
+from bvh import BVH, pick
+from camera import Camera
+from frames import FramePipeline
+from lighting import point_light
+from pipeline import vertex_normals, SHADING_MODES
+from primitives import cube
+from profiler import Profiler
+from renderer import Renderer
+from resolution import ResolutionController, TARGET_FPS
 
 pg.init()
 
 WIDTH, HEIGHT = 800, 600
 SSAA_SCALE = 2  # Scale factor for SSAA, use 2 for 2x SSAA
-
-# Define high-resolution surface for SSAA
-high_res_surface = pg.Surface((WIDTH * SSAA_SCALE, HEIGHT * SSAA_SCALE))
+# Threads of the tiled z-buffer rasterizer: every core when there is more than one, else off
+RASTER_WORKERS = os.cpu_count() if (os.cpu_count() or 1) > 1 else None
 
 screen = pg.display.set_mode((WIDTH, HEIGHT))
 pg.display.set_caption("3D Camera Orbit with Mouse")
 
 font = pg.font.SysFont(None, 36)
+small_font = pg.font.SysFont(None, 22)
+
+PROFILE_JSON, PROFILE_CSV = "profile_stats.json", "profile_stats.csv"  # Written on exit when profiling
+IDLE_WAIT_MS = 50  # How long an idle frame blocks on pygame events before polling the UI again
 
-# Define vertices, edges, faces, and face colors
-vertices = np.array([
-    [-1, -1, -1],
-    [1, -1, -1],
-    [1, 1, -1],
-    [-1, 1, -1],
-    [-1, -1, 1],
-    [1, -1, 1],
-    [1, 1, 1],
-    [-1, 1, 1]
-])
-edges = [
-    (0, 1), (1, 2), (2, 3), (3, 0),
-    (4, 5), (5, 6), (6, 7), (7, 4),
-    (0, 4), (1, 5), (2, 6), (3, 7)
-]
-faces = [
-    [0, 1, 2, 3],  # Front face
-    [4, 5, 6, 7],  # Back face
-    [0, 1, 5, 4],  # Bottom face
-    [2, 3, 7, 6],  # Top face
-    [1, 2, 6, 5],  # Right face
-    [0, 3, 7, 4]   # Left face
-]
-face_colors = [
-    (255, 255, 255),   # White
-    (255, 255, 255),   # White
-    (255, 255, 255),   # White
-    (255, 255, 255),   # White
-    (255, 255, 255),   # White
-    (255, 255, 255),   # White
-]
+# The cube's positions, packed faces and per-face colors (white to start with)
+mesh = cube()
+mesh.bvh = BVH.build(mesh.positions, mesh.face_indices, mesh.face_offsets)  # Ray queries for mouse picking and shadows
+mesh.vertex_normals = vertex_normals(mesh.positions, mesh.face_indices, mesh.face_offsets)  # Computed once for smooth shading
 
 # Define a static light source position (e.g., top-right)
 light_pos = np.array([5, 5, 5])  # Static light source
 ambient_light = 0.2
 diffuse_light = 0.8
-
-def rotate_x(angle):
-    cos_angle, sin_angle = np.cos(angle), np.sin(angle)
-    return np.array([
-        [1, 0, 0],
-        [0, cos_angle, -sin_angle],
-        [0, sin_angle, cos_angle]
-    ])
-
-def rotate_y(angle):
-    cos_angle, sin_angle = np.cos(angle), np.sin(angle)
-    return np.array([
-        [cos_angle, 0, sin_angle],
-        [0, 1, 0],
-        [-sin_angle, 0, cos_angle]
-    ])
-
-def project(points, scale=100):
-    return [(int(p[0] * scale) + WIDTH // 2, int(p[1] * scale) + HEIGHT // 2) for p in points]
-
-def calculate_face_depth(face_vertices):
-    """Calculate the average depth of the face vertices relative to the camera."""
-    cam_pos = np.array([0, 0, 0])  # Camera at the origin
-    depths = [np.dot(v - cam_pos, np.array([0, 0, 1])) for v in face_vertices]
-    return np.mean(depths)
-
-def compute_face_normal(face_vertices):
-    """Calculate the normal vector for a face."""
-    v0, v1, v2 = face_vertices[0], face_vertices[1], face_vertices[2]
-    edge1 = v1 - v0
-    edge2 = v2 - v0
-    normal = np.cross(edge1, edge2)
-    norm_length = np.linalg.norm(normal)
-    return normal / norm_length if norm_length > 0 else normal
-
-def compute_lighting(normal, face_center):
-    """Compute the lighting for a face based on its normal and the light source position."""
-    light_dir = light_pos - face_center
-    light_dir = light_dir / np.linalg.norm(light_dir)
-    dot_product = np.dot(normal, light_dir)
-    diffuse = max(dot_product, 0) * diffuse_light
-    return ambient_light + diffuse
+lights = [point_light(light_pos, diffuse_light)]  # Add point_light or directional_light entries for more lights
 
 def update_face_colors():
     """Change the colors of the cube faces to random colors and update the color pickers."""
-    global face_colors
-    face_colors = [(random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)) for _ in face_colors]
+    mesh.colors[:] = [(random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)) for _ in range(mesh.face_count)]
 
     # Convert colors to the [0.0, 1.0] range and update color pickers
-    for i, color in enumerate(face_colors):
+    for i, color in enumerate(mesh.colors.tolist()):
         dpg.set_value(f"color_picker_{i}", [c / 255.0 for c in color])  # Update color picker value
-        print(f"Face {i + 1} color randomized to {face_colors[i]}")
+        print(f"Face {i + 1} color randomized to {tuple(color)}")
 
 def update_color_picker(i, sender, app_data):
     """Update face color from color picker."""
@@ -114,8 +57,8 @@ def update_color_picker(i, sender, app_data):
         if i is not None and color is not None and len(color) >= 3:  # Ensure there is color data
             # Convert the color from [0.0, 1.0] range to [0, 255] range
             color = tuple(int(c * 255) for c in color[:3])
-            face_colors[i] = color
-            print(f"Face {i + 1} color updated to {face_colors[i]}")
+            mesh.colors[i] = color
+            print(f"Face {i + 1} color updated to {color}")
         else:
             print(f"Received invalid data for face {i if i is not None else 'unknown'}")
     except Exception as e:
@@ -127,51 +70,29 @@ def is_face_facing_light(normal, face_center):
     light_dir = light_dir / np.linalg.norm(light_dir)
     return np.dot(normal, light_dir) > 0
 
-class Camera:
-    def __init__(self):
-        self.angle_pitch = self.angle_yaw = 0
-        self.distance = 5
-        self.rotation_speed = 0.01
-        self.scale_factor = 1.0  # Scale factor for the cube
-        self.zoom_speed = 0.1    # Speed at which the cube scales
-        self.min_scale = 0.05     # Minimum scale factor
-        self.max_scale = 10.0     # Maximum scale factor
-        self.last_mouse_pos = None
-
-    def control(self):
-        if pg.mouse.get_pressed()[0]:
-            mouse_x, mouse_y = pg.mouse.get_pos()
-            if self.last_mouse_pos:
-                dx, dy = mouse_x - self.last_mouse_pos[0], mouse_y - self.last_mouse_pos[1]
-                self.angle_yaw += dx * self.rotation_speed
-                self.angle_pitch -= dy * self.rotation_speed
-            self.last_mouse_pos = (mouse_x, mouse_y)
-        else:
-            self.last_mouse_pos = None
-
-    def get_position(self):
-        x = self.distance * np.cos(self.angle_pitch) * np.sin(self.angle_yaw)
-        y = self.distance * np.sin(self.angle_pitch)
-        z = self.distance * np.cos(self.angle_pitch) * np.cos(self.angle_yaw)
-        return np.array([x, y, z])
-
-    def zoom_in(self):
-        self.scale_factor = max(self.min_scale, self.scale_factor - self.zoom_speed)
-        #print(f"Zoomed in: New scale factor = {self.scale_factor}")
-
-    def zoom_out(self):
-        self.scale_factor = min(self.max_scale, self.scale_factor + self.zoom_speed)
-        #print(f"Zoomed out: New scale factor = {self.scale_factor}")
-
-
 def main():
     clock = pg.time.Clock()
     camera = Camera()
+    profiler = Profiler()
+    renderer = Renderer(WIDTH, HEIGHT, SSAA_SCALE, profiler, workers=RASTER_WORKERS)
+    renderer.lights, renderer.ambient_light = lights, ambient_light
+    # From here on the renderer belongs to the pipeline's worker thread; settings reach it with every frame request
+    pipeline = FramePipeline(renderer)
+    controller = ResolutionController(TARGET_FPS)
+    render_clock = pg.time.Clock()  # Ticks once per newly rendered frame
 
     show_rays = False  # Flag to toggle raycasting lines
     lighting_enabled = True  # Flag to toggle lighting
     ssaa_enabled = False  # Flag to toggle SSAA
+    adaptive_enabled = False  # Flag to toggle adaptive render resolution
     rainbow_mode = False  # Flag to toggle rainbow mode
+    zbuffer_enabled = False  # Flag to toggle the z-buffer rasterizer
+    culling_enabled = True  # Flag to toggle backface and view culling
+    shadows_enabled = False  # Flag to toggle BVH shadow rays
+    lod_enabled = True  # Flag to toggle picking a simplified level for meshes with LODs
+    tiles_enabled = pipeline.defaults['tiles_enabled']  # Flag to toggle the tiled rasterizer, when there are workers
+    shading = pipeline.defaults['shading']
+    ssaa_mode = pipeline.defaults['ssaa_mode']
     hue = 0  # Initial hue value for rainbow mode
 
     def toggle_raycasting(sender, app_data):
@@ -188,35 +109,134 @@ def main():
         nonlocal ssaa_enabled
         ssaa_enabled = app_data
         print(f"SSAA {'enabled' if ssaa_enabled else 'disabled'}")
+        update_scale_range()
+
+    def update_scale_range():
+        # Adaptive resolution may go up to the SSAA multiple only while SSAA is on
+        controller.max_scale = SSAA_SCALE if ssaa_enabled else 1.0
+        controller.reset()
+        dpg.set_value("render_scale_text", f"Render scale: {controller.scale:.2f}")
+
+    def toggle_adaptive(sender, app_data):
+        nonlocal adaptive_enabled
+        adaptive_enabled = app_data
+        print(f"Adaptive resolution {'enabled' if adaptive_enabled else 'disabled'}")
+        update_scale_range()
+
+    def set_target_fps(sender, app_data):
+        controller.target_fps = app_data
+        print(f"Target FPS set to {app_data}")
+
+    def set_ssaa_mode(sender, app_data):
+        nonlocal ssaa_mode
+        ssaa_mode = app_data
+        print(f"SSAA mode set to {app_data}")
+
+    def set_shading(sender, app_data):
+        nonlocal shading
+        shading = app_data
+        print(f"Shading set to {app_data}")
 
     def toggle_rainbow_mode(sender, app_data):
         nonlocal rainbow_mode
         rainbow_mode = app_data
         print(f"Rainbow mode {'enabled' if rainbow_mode else 'disabled'}")
 
+    def toggle_zbuffer(sender, app_data):
+        nonlocal zbuffer_enabled
+        zbuffer_enabled = app_data
+        print(f"Z-buffer {'enabled' if zbuffer_enabled else 'disabled'}")
+
+    def toggle_profiler(sender, app_data):
+        profiler.enabled = app_data
+        print(f"Profiler {'enabled' if profiler.enabled else 'disabled'}")
+
+    def toggle_shadows(sender, app_data):
+        nonlocal shadows_enabled
+        shadows_enabled = app_data
+        print(f"Shadows {'enabled' if shadows_enabled else 'disabled'}")
+
+    def toggle_lod(sender, app_data):
+        nonlocal lod_enabled
+        lod_enabled = app_data
+        print(f"Level of detail {'enabled' if lod_enabled else 'disabled'}")
+
+    def toggle_tiles(sender, app_data):
+        nonlocal tiles_enabled
+        tiles_enabled = app_data
+        print(f"Tiled rasterizer {'enabled' if tiles_enabled else 'disabled'}")
+
+    def toggle_culling(sender, app_data):
+        nonlocal culling_enabled
+        culling_enabled = app_data
+        print(f"Culling {'enabled' if culling_enabled else 'disabled'}")
+
     color_callbacks = [lambda sender, app_data, i=i: update_color_picker(i, sender, app_data) for i in range(6)]
 
-    create_ui(WIDTH, HEIGHT, update_face_colors, color_callbacks, face_colors, toggle_raycasting, toggle_lighting, toggle_ssaa, toggle_rainbow_mode)
+    create_ui(WIDTH, HEIGHT, update_face_colors, color_callbacks, [tuple(color) for color in mesh.colors.tolist()], toggle_raycasting, toggle_lighting, toggle_ssaa, toggle_rainbow_mode,
+              toggle_zbuffer=toggle_zbuffer, toggle_culling=toggle_culling,
+              toggle_profiler=toggle_profiler, set_ssaa_mode=set_ssaa_mode, toggle_shadows=toggle_shadows,
+              set_shading=set_shading, toggle_adaptive=toggle_adaptive, set_target_fps=set_target_fps,
+              target_fps=controller.target_fps, toggle_lod=toggle_lod,
+              toggle_tiles=toggle_tiles if RASTER_WORKERS else None)
 
     running = True
+    idle = False
+    frame = None  # Last completed frame, on the pipeline's front buffer
+    overlay_state = None
+    picked = -1  # Face under the last right click
 
     while running:
-        for event in pg.event.get():
-            if event.type == pg.QUIT:
-                running = False
-            if event.type == pg.KEYDOWN:
-                if event.key == pg.K_r:  # Toggle raycasting lines with the 'R' key
-                    show_rays = not show_rays
-                if event.key == pg.K_l:  # Toggle lighting with the 'L' key
-                    lighting_enabled = not lighting_enabled
-                    print(f"Lighting {'enabled' if lighting_enabled else 'disabled'}")
-            if event.type == pg.MOUSEBUTTONDOWN:
-                if event.button == 4:  # Scroll up (zoom in)
-                    camera.zoom_in()
-                elif event.button == 5:  # Scroll down (zoom out)
-                    camera.zoom_out()
-
-        camera.control()
+        with profiler.scope('control'):
+            if idle:
+                # Nothing changed last frame: sleep until input arrives instead of spinning at 60 Hz
+                event = pg.event.wait(IDLE_WAIT_MS)
+                if event.type != pg.NOEVENT:
+                    pg.event.post(event)
+            for event in pg.event.get():
+                if event.type == pg.QUIT:
+                    running = False
+                if event.type == pg.KEYDOWN:
+                    if event.key == pg.K_r:  # Toggle raycasting lines with the 'R' key
+                        show_rays = not show_rays
+                    if event.key == pg.K_l:  # Toggle lighting with the 'L' key
+                        lighting_enabled = not lighting_enabled
+                        print(f"Lighting {'enabled' if lighting_enabled else 'disabled'}")
+                    if event.key == pg.K_z:  # Toggle the z-buffer rasterizer with the 'Z' key
+                        zbuffer_enabled = not zbuffer_enabled
+                        dpg.set_value("zbuffer_checkbox", zbuffer_enabled)
+                    if event.key == pg.K_c:  # Toggle culling with the 'C' key
+                        culling_enabled = not culling_enabled
+                        dpg.set_value("culling_checkbox", culling_enabled)
+                    if event.key == pg.K_s:  # Toggle shadows with the 'S' key
+                        shadows_enabled = not shadows_enabled
+                        dpg.set_value("shadows_checkbox", shadows_enabled)
+                    if event.key == pg.K_t and RASTER_WORKERS:  # Toggle the tiled rasterizer with the 'T' key
+                        toggle_tiles(None, not tiles_enabled)
+                        dpg.set_value("tiles_checkbox", tiles_enabled)
+                    if event.key == pg.K_d:  # Toggle level of detail with the 'D' key
+                        toggle_lod(None, not lod_enabled)
+                        dpg.set_value("lod_checkbox", lod_enabled)
+                    if event.key == pg.K_g:  # Cycle flat, Gouraud and Phong shading with the 'G' key
+                        set_shading(None, SHADING_MODES[(SHADING_MODES.index(shading) + 1) % len(SHADING_MODES)])
+                        dpg.set_value("shading_combo", shading)
+                    if event.key == pg.K_a:  # Toggle adaptive resolution with the 'A' key
+                        toggle_adaptive(None, not adaptive_enabled)
+                        dpg.set_value("adaptive_checkbox", adaptive_enabled)
+                    if event.key == pg.K_p:  # Toggle the profiler overlay with the 'P' key
+                        profiler.enabled = not profiler.enabled
+                        dpg.set_value("profiler_checkbox", profiler.enabled)
+                if event.type == pg.MOUSEBUTTONDOWN:
+                    if event.button == 4:  # Scroll up (zoom in)
+                        camera.zoom_in()
+                    elif event.button == 5:  # Scroll down (zoom out)
+                        camera.zoom_out()
+                    elif event.button == 3:  # Right click picks the face under the cursor
+                        picked, distance = pick(mesh.bvh, camera, event.pos, WIDTH, HEIGHT)
+                        if picked >= 0:
+                            print(f"Picked face {picked + 1} at distance {distance:.2f}")
+
+            camera.control()
 
         if rainbow_mode:
             hue = (hue + 1) % 360  # Increment hue and wrap around at 360
@@ -224,60 +244,75 @@ def main():
                 c = pg.Color(0, 0, 0)
                 adjusted_hue = (hue + i * 60) % 360
                 c.hsva = (adjusted_hue, 100, 100, 100)
-                face_colors[i] = tuple(c)[:3]  # Only keep the RGB components
-
-        if ssaa_enabled:
-            high_res_surface.fill((0, 0, 0))
-
-        cam_pos = camera.get_position()
-        translated_vertices = vertices * camera.scale_factor  # Scale the vertices
-        rotation_matrix = np.dot(rotate_x(camera.angle_pitch), rotate_y(camera.angle_yaw))
-        rotated_vertices = np.dot(translated_vertices, rotation_matrix)
-        projected_vertices = project(rotated_vertices)
-
-        face_distances = []
-        for i, face in enumerate(faces):
-            face_vertices = [rotated_vertices[v] for v in face]
-            face_center = np.mean(face_vertices, axis=0)
-            face_normal = compute_face_normal(face_vertices)
-
-            if lighting_enabled:
-                face_lighting = compute_lighting(face_normal, face_center)
-                face_color = np.array(face_colors[i]) * face_lighting
-            else:
-                face_color = np.array(face_colors[i])
-                
-            face_color = np.clip(face_color, 0, 255).astype(int)
-            face_distance = calculate_face_depth(face_vertices)
-            face_distances.append((i, face_distance, [projected_vertices[v] for v in face], face_color, face_center, face_normal))
-
-        face_distances.sort(key=lambda x: x[1], reverse=True)
-
-        if ssaa_enabled:
-            for i, _, polygon, color, _, _ in face_distances:
-                pg.draw.polygon(high_res_surface, tuple(color), [(int(p[0] * SSAA_SCALE), int(p[1] * SSAA_SCALE)) for p in polygon])
-            
-            scaled_surface = pg.transform.scale(high_res_surface, (WIDTH, HEIGHT))
-            screen.blit(scaled_surface, (0, 0))
-        else:
-            for i, _, polygon, color, _, _ in face_distances:
-                pg.draw.polygon(screen, tuple(color), polygon)
-        
-        if show_rays:
-            light_pos_screen = project([light_pos])[0]
-            for _, _, polygon, _, face_center, face_normal in face_distances:
-                face_center_screen = project([face_center])[0]
-                ray_color = (255, 0, 0) if not is_face_facing_light(face_normal, face_center) else (255, 255, 255)
-                pg.draw.line(screen, ray_color, light_pos_screen, face_center_screen, 1)
-        
-        fps = clock.get_fps()
-        fps_text = font.render(f"FPS: {int(fps)}", True, (255, 255, 255))
-        screen.blit(fps_text, (2, 2))
-
-        render_ui()
-        pg.display.flip()
+                mesh.colors[i] = tuple(c)[:3]  # Only keep the RGB components
+
+        # The worker renders from a snapshot of the camera, colors and settings, while this thread goes on
+        # with input, the UI and presenting the previous frame
+        submitted = pipeline.submit(mesh, camera, mesh.colors, lighting_enabled=lighting_enabled,
+                                    ssaa_enabled=ssaa_enabled, ssaa_mode=ssaa_mode,
+                                    render_scale=controller.scale if adaptive_enabled else None,
+                                    zbuffer_enabled=zbuffer_enabled, culling_enabled=culling_enabled,
+                                    shadows_enabled=shadows_enabled, lod_enabled=lod_enabled,
+                                    tiles_enabled=tiles_enabled, shading=shading)
+        completed = pipeline.acquire()
+        if completed is not None:
+            frame = completed
+            if frame.changed:
+                render_clock.tick()
+                # Only frames that were actually rendered say anything about the cost of the current scale
+                if adaptive_enabled and controller.observe(frame.render_time):
+                    dpg.set_value("render_scale_text", f"Render scale: {controller.scale:.2f}")
+
+        # The composed frame on screen is reused as long as neither the render nor the overlays changed
+        state = (show_rays, culling_enabled, profiler.enabled, picked)
+        redraw = frame is not None and ((completed is not None and completed.changed) or state != overlay_state or
+                                        profiler.enabled)
+        if frame is not None:
+            overlay_state = state
+        idle = not redraw and not submitted and not rainbow_mode and pipeline.idle
+
+        if redraw:
+            screen.blit(frame.surface, (0, 0))
+
+            with profiler.scope('rays'):
+                if show_rays:
+                    normals, centers = frame.normals, frame.centers
+                    points, in_front = frame.project(np.vstack([light_pos, centers]))
+                    light_pos_screen, points = points[0].tolist(), points[1:].tolist()
+                    for k in range(len(centers)):
+                        if not (in_front[0] and in_front[k + 1]):
+                            continue
+                        ray_color = (255, 0, 0) if not is_face_facing_light(normals[k], centers[k]) else (255, 255, 255)
+                        pg.draw.line(screen, ray_color, light_pos_screen, points[k], 1)
+
+            if picked >= 0:
+                corners = mesh.positions[mesh.face_indices[mesh.face_offsets[picked]:mesh.face_offsets[picked + 1]]]
+                points, in_front = frame.project(corners)
+                if in_front.all():
+                    pg.draw.lines(screen, (255, 255, 0), True, points.tolist(), 2)
+
+            fps = render_clock.get_fps()
+            fps_label = f"FPS: {int(fps)}" + (f" @ {controller.scale:.2f}x" if adaptive_enabled else "")
+            fps_text = font.render(fps_label, True, (255, 255, 255))
+            screen.blit(fps_text, (2, 2))
+            if culling_enabled:
+                screen.blit(font.render(frame.cull_stats, True, (255, 255, 255)), (2, 30))
+            if profiler.enabled:
+                profiler.draw_overlay(screen, small_font)
+
+        with profiler.scope('ui'):
+            render_ui()
+        if redraw:
+            with profiler.scope('flip'):
+                pg.display.flip()
         clock.tick(60)
 
+    pipeline.close()
+    if profiler.names:
+        profiler.dump_json(PROFILE_JSON)
+        profiler.dump_csv(PROFILE_CSV)
+        print(f"Profile written to {PROFILE_JSON} and {PROFILE_CSV}")
+
     dpg.destroy_context()
     pg.quit()
 
@@ -0,0 +1,333 @@
+"""Headless frame-time benchmark.
+
+Renders the cube and car.obj along a scripted camera path with no window,
+using the same Renderer as the interactive viewer, and reports per-stage and
+total frame-time percentiles. Example:
+
+    python benchmark.py --frames 120 --resolutions 800x600 1600x1200 --ssaa 1 2 --output bench.json
+
+Pass --workers 1 2 4 8 to measure how the tiled z-buffer rasterizer scales
+with thread count; 0 selects the untiled single-threaded path. With
+--check-lod-seams nothing is timed: every level-of-detail switch is rendered
+from both sides and the run fails if any pixel changes. --check-parser
+likewise only compares obj_loader.read_obj against a plain line-by-line
+parse, of a sample with indented and commented records and of every OBJ
+file in --meshes.
+"""
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse
+import json
+import platform
+import tempfile
+import time
+import numpy as np
+import pygame as pg
+from camera import Camera
+from bvh import BVH
+from lighting import point_light, directional_light
+from lod import build_lods, LODSelector
+from loading import load_all
+from obj_loader import read_obj
+from pipeline import vertex_normals, SHADING_MODES
+from primitives import cube
+from profiler import Profiler
+from renderer import Renderer
+from resolution import ResolutionController
+from scene import grid_scene
+from ssaa import SSAA_MODES
+
+PERCENTILES = (50, 90, 99)
+
+
+class ScriptedCamera(Camera):
+    """Camera pose driven by a deterministic orbit instead of the mouse."""
+
+    def __init__(self, frames, zoom=1.0):
+        super().__init__()
+        self.frames = frames
+        self.zoom = zoom
+
+    def seek(self, frame):
+        t = frame / max(self.frames, 1)
+        self.angle_yaw = 2 * np.pi * t
+        self.angle_pitch = 0.4 * np.sin(4 * np.pi * t)
+        self.scale_factor = self.zoom * (1.0 + 0.25 * np.sin(2 * np.pi * t))
+
+
+def bench_lights(count):
+    """The viewer's point light plus count - 1 directional lights spread around the mesh."""
+    lights = [point_light((5, 5, 5), 0.8)]
+    for k in range(1, count):
+        angle = 2 * np.pi * k / count
+        lights.append(directional_light((np.cos(angle), -1.0, np.sin(angle)), 0.3))
+    return lights
+
+
+def load_meshes(names):
+    """Meshes by name, each with its BVH, vertex normals, LOD levels and white face colors."""
+    # OBJ files all load concurrently in the background
+    files = [name for name in names if name != 'cube']
+    loads = dict(zip(files, load_all(files)))
+    meshes = {}
+    for name in names:
+        if name == 'cube':
+            mesh = cube()
+            mesh.bvh = BVH.build(mesh.positions, mesh.face_indices, mesh.face_offsets)
+            mesh.vertex_normals = vertex_normals(mesh.positions, mesh.face_indices, mesh.face_offsets)
+            mesh.lods = build_lods(mesh.positions, mesh.face_indices, mesh.face_offsets, mesh.vertex_normals,
+                                   levels=0)
+        else:
+            mesh = loads[name].result()
+            name = os.path.splitext(os.path.basename(name))[0]
+        mesh.colors = np.full((mesh.face_count, 3), 255, dtype=np.uint8)
+        meshes[name] = mesh
+    return meshes
+
+
+def summarize(samples):
+    samples = np.asarray(samples) * 1000.0
+    summary = {f"p{p}": float(np.percentile(samples, p)) for p in PERCENTILES}
+    summary['mean'] = float(samples.mean())
+    return summary
+
+
+def run_case(mesh, width, height, ssaa, mode, frames, warmup, ssaa_mode=SSAA_MODES[0], workers=0, shadows=False,
+             lod=False, zoom=1.0, shading=SHADING_MODES[0], lights=1, instances=1, target_fps=None):
+    profiler = Profiler(enabled=True, history=frames)
+    renderer = Renderer(width, height, ssaa_scale=ssaa, profiler=profiler, ssaa_mode=ssaa_mode, workers=workers)
+    renderer.ssaa_enabled = ssaa > 1
+    renderer.zbuffer_enabled = mode == 'zbuffer'
+    renderer.shadows_enabled = shadows
+    renderer.shading = shading
+    renderer.lights = bench_lights(lights)
+    renderer.lod_enabled = lod
+    scene = grid_scene(mesh, instances) if instances > 1 else None
+    camera = ScriptedCamera(frames, zoom)
+    controller = ResolutionController(target_fps, max_scale=max(ssaa, 1)) if target_fps else None
+    scales = []
+    for frame in range(warmup + frames):
+        if frame == warmup:
+            profiler.reset()
+        camera.seek(frame - warmup)
+        if controller is not None:
+            renderer.render_scale = controller.scale
+            scales.append(controller.scale)
+        start = time.perf_counter()
+        with profiler.scope('frame'):
+            if scene is not None:
+                # The merged scene has no BVH, so instanced runs are unshadowed
+                renderer.render(scene.merged(camera, renderer.height) if lod else scene.merged(), camera)
+            else:
+                renderer.render(mesh, camera)
+        if controller is not None:
+            controller.observe(time.perf_counter() - start)
+    renderer.close()
+    totals = profiler.samples('frame')
+    result = {
+        'total_ms': summarize(totals),
+        'stages_ms': {name: summarize(profiler.samples(name)) for name in profiler.names if name != 'frame'},
+        'fps_mean': float(len(totals) / totals.sum()),
+    }
+    if controller is not None:
+        result['render_scale'] = {'mean': float(np.mean(scales[warmup:])), 'final': controller.scale}
+    return result
+
+
+def check_lod_seams(mesh, width, height, yaws=4):
+    """Differing pixels between the frames just before and just after every LOD switch.
+
+    For each level boundary the camera is zoomed to where the switch happens
+    and the level is selected a hair either side of it. Both selections are
+    drawn from the boundary camera in every mode and shading, so any
+    difference is a pop; returns (boundary, mode, shading, yaw, pixels) rows.
+    """
+    selector = LODSelector(mesh)
+    colors = np.random.default_rng(0).integers(64, 256, (mesh.face_count, 3), dtype=np.uint8)
+    camera = Camera()
+    camera.angle_pitch = 0.4
+    focal = height / 2 / np.tan(np.radians(camera.fov) / 2)
+    rows = []
+    for boundary in range(1, len(mesh.lods)):
+        # Scale at which the projected diameter is exactly the size this level switches at
+        size = selector.full_detail_pixels / 2 ** boundary
+        scale = size * camera.distance / (selector.radius * (2 * focal + size))
+        sides = []
+        for nudge in (1 + 1e-6, 1 - 1e-6):
+            camera.scale_factor = scale * nudge
+            level, source_faces = selector.select(camera, height)
+            sides.append((level, colors[source_faces]))
+        camera.scale_factor = scale
+        for mode in ('painter', 'zbuffer'):
+            for shading in SHADING_MODES:
+                renderer = Renderer(width, height)
+                renderer.zbuffer_enabled = mode == 'zbuffer'
+                renderer.shading = shading
+                for yaw in np.linspace(0, 2 * np.pi, yaws, endpoint=False):
+                    camera.angle_yaw = yaw
+                    frames = [pg.surfarray.array3d(renderer.render(level, camera, level_colors))
+                              for level, level_colors in sides]
+                    pixels = int(np.any(frames[0] != frames[1], axis=2).sum())
+                    rows.append((boundary, mode, shading, float(yaw), pixels))
+                renderer.close()
+    return rows
+
+
+PARSER_SAMPLE = """# Records indented, with tabs and followed by comments, which are all valid OBJ
+mtllib sample.mtl # library
+  v 0 0 0
+\tv 1 0 0   # trailing comment
+v 1 1 0#no space
+   v 0 1 0
+vt 0 0
+  vt 1 0 0
+vn 0 0 1 # normal
+o box
+  usemtl red # material
+f 1/1/1 2/2/1 3/1/1 # triangle
+   f -4//1 -2//1 -1//1
+\tf 1 2 3 4 # quad
+#f 1 2 3
+    # indented comment
+"""
+
+
+def reference_obj(filename):
+    """Vertex, texcoord and normal records and packed faces of an OBJ file, parsed one line at a time.
+
+    Kept deliberately simple, as the reference read_obj is checked against.
+    """
+    records = {'v': [], 'vt': [], 'vn': []}
+    corners = {'v': [], 'vt': [], 'vn': []}
+    offsets = [0]
+    with open(filename, encoding='utf-8', errors='replace') as file:
+        for line in file:
+            tokens = line.split('#', 1)[0].split()
+            if not tokens:
+                continue
+            keyword, values = tokens[0], tokens[1:]
+            if keyword in records:
+                size = 2 if keyword == 'vt' else 3
+                values = [float(value) for value in values[:size]]
+                records[keyword].append(values + [0.0] * (size - len(values)))
+            elif keyword == 'f':
+                for corner in values:
+                    parts = corner.split('/')
+                    for k, name in enumerate(('v', 'vt', 'vn')):
+                        index = int(parts[k]) if k < len(parts) and parts[k] else 0
+                        corners[name].append(index - 1 if index > 0 else len(records[name]) + index if index else -1)
+                offsets.append(offsets[-1] + len(values))
+    return {'positions': np.array(records['v'], dtype=np.float32).reshape(-1, 3),
+            'texcoords': np.array(records['vt'], dtype=np.float32).reshape(-1, 2),
+            'normals': np.array(records['vn'], dtype=np.float32).reshape(-1, 3),
+            'face_indices': np.array(corners['v'], dtype=np.int32),
+            'face_texcoords': np.array(corners['vt'], dtype=np.int32),
+            'face_normals': np.array(corners['vn'], dtype=np.int32),
+            'face_offsets': np.array(offsets, dtype=np.int32)}
+
+
+def check_parser(filenames):
+    """(file, arrays that differ) for PARSER_SAMPLE and every file, comparing read_obj with reference_obj."""
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        sample = os.path.join(directory, 'sample.obj')
+        with open(sample, 'w') as file:
+            file.write(PARSER_SAMPLE)
+        for filename in [sample] + list(filenames):
+            mesh, reference = read_obj(filename), reference_obj(filename)
+            rows.append((filename, [name for name, expected in reference.items()
+                                    if not np.array_equal(getattr(mesh, name), expected)]))
+    return rows
+
+
+def parse_resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless render benchmark")
+    parser.add_argument('--meshes', nargs='+', default=['cube', './objects/car.obj'])
+    parser.add_argument('--resolutions', nargs='+', type=parse_resolution, default=[(320, 240), (800, 600)])
+    parser.add_argument('--ssaa', nargs='+', type=int, default=[1, 2])
+    parser.add_argument('--modes', nargs='+', choices=['painter', 'zbuffer'], default=['painter', 'zbuffer'])
+    parser.add_argument('--ssaa-mode', choices=SSAA_MODES, default=SSAA_MODES[0])
+    parser.add_argument('--shading', choices=SHADING_MODES, default=SHADING_MODES[0])
+    parser.add_argument('--target-fps', type=float, help="adapt the render scale to hold this frame rate")
+    parser.add_argument('--instances', type=int, default=1, help="render a grid of this many copies as one scene")
+    parser.add_argument('--lights', type=int, default=1, help="number of lights, the first a point light")
+    parser.add_argument('--shadows', action='store_true', help="cast BVH shadow rays from the light")
+    parser.add_argument('--zoom', type=float, default=1.0, help="camera scale_factor the orbit is centered on")
+    parser.add_argument('--lod', action='store_true', help="pick a simplified level from the projected size")
+    parser.add_argument('--workers', nargs='+', type=int, default=[0])
+    parser.add_argument('--frames', type=int, default=60)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--check-lod-seams', action='store_true',
+                        help="instead of timing, check every LOD switch renders without a visible pop")
+    parser.add_argument('--check-parser', action='store_true',
+                        help="instead of timing, check read_obj against a line-by-line parse of the OBJ files")
+    args = parser.parse_args()
+
+    if args.check_parser:
+        failed = 0
+        for filename, differing in check_parser([name for name in args.meshes if name != 'cube']):
+            failed += bool(differing)
+            print(f"{filename}: {'differs in ' + ', '.join(differing) if differing else 'ok'}")
+        raise SystemExit(1 if failed else 0)
+    pg.init()
+    if args.check_lod_seams:
+        popped = 0
+        for name, mesh in load_meshes(args.meshes).items():
+            for width, height in args.resolutions:
+                for boundary, mode, shading, yaw, pixels in check_lod_seams(mesh, width, height):
+                    popped += pixels > 0
+                    print(f"{name:>6} {width}x{height} level {boundary - 1}->{boundary} {mode:<7} {shading:<7} "
+                          f"yaw={yaw:.2f} {'POP ' if pixels else 'ok  '}{pixels} pixels differ")
+        pg.quit()
+        raise SystemExit(1 if popped else 0)
+    results = []
+    for name, mesh in load_meshes(args.meshes).items():
+        for width, height in args.resolutions:
+            for ssaa in args.ssaa:
+                for mode in args.modes:
+                    baseline = None
+                    # Only the z-buffer path is tiled, so the painter runs once
+                    for workers in args.workers if mode == 'zbuffer' else [0]:
+                        case = {'mesh': name, 'width': width, 'height': height, 'ssaa': ssaa,
+                                'ssaa_mode': args.ssaa_mode, 'mode': mode, 'workers': workers,
+                                'shading': args.shading, 'lights': args.lights, 'shadows': args.shadows,
+                                'lod': args.lod, 'zoom': args.zoom, 'instances': args.instances,
+                                'target_fps': args.target_fps}
+                        case.update(run_case(mesh, width, height, ssaa, mode, args.frames, args.warmup,
+                                             args.ssaa_mode, workers, args.shadows, args.lod, args.zoom,
+                                             args.shading, args.lights, args.instances,
+                                             args.target_fps))
+                        total = case['total_ms']
+                        baseline = baseline or total['p50']
+                        case['speedup'] = baseline / total['p50']
+                        results.append(case)
+                        print(f"{name:>6} {width}x{height} ssaa={ssaa} {mode:<7} workers={workers} "
+                              f"p50={total['p50']:.2f}ms p90={total['p90']:.2f}ms p99={total['p99']:.2f}ms "
+                              f"speedup={case['speedup']:.2f}x" +
+                              (f" scale={case['render_scale']['mean']:.2f}" if 'render_scale' in case else ""))
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pygame': pg.version.ver,
+        'frames': args.frames,
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Wrote {args.output}")
+    pg.quit()
+
+
+if __name__ == "__main__":
+    main()
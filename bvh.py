@@ -0,0 +1,232 @@
+import numpy as np
+from pipeline import face_normals, face_centers
+from rasterizer import triangulate
+from lighting import light_vectors
+
+LEAF_SIZE = 4  # Triangles per leaf node
+EPSILON = 1e-9
+
+
+def intersect_triangles(origins, directions, triangles):
+    """Möller-Trumbore ray/triangle test for matching rows of rays and (n, 3, 3) triangles.
+
+    Returns the hit distance along each ray, inf where it misses. Both sides of
+    a triangle count as a hit.
+    """
+    v0 = triangles[:, 0]
+    edge1, edge2 = triangles[:, 1] - v0, triangles[:, 2] - v0
+    p = np.cross(directions, edge2)
+    det = np.einsum('ij,ij->i', edge1, p)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_det = 1.0 / det
+        s = origins - v0
+        u = np.einsum('ij,ij->i', s, p) * inv_det
+        q = np.cross(s, edge1)
+        v = np.einsum('ij,ij->i', directions, q) * inv_det
+        t = np.einsum('ij,ij->i', edge2, q) * inv_det
+        hit = (np.abs(det) > EPSILON) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > EPSILON)
+    return np.where(hit, t, np.inf)
+
+
+def _spread_bits(x):
+    """Every bit of 21-bit unsigned integers moved to every third bit position."""
+    x = x & np.uint64(0x1fffff)
+    for shift, mask in ((32, 0x1f00000000ffff), (16, 0x1f0000ff0000ff), (8, 0x100f00f00f00f00f),
+                        (4, 0x10c30c30c30c30c3), (2, 0x1249249249249249)):
+        x = (x | (x << np.uint64(shift))) & np.uint64(mask)
+    return x
+
+
+def morton_codes(points):
+    """63-bit Morton codes of (n, 3) points, quantized to 2**21 steps per axis of their bounding box."""
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    scale = (1 << 21) - 1
+    cells = ((points - lo) / np.where(hi > lo, hi - lo, 1) * scale).astype(np.uint64)
+    x, y, z = (_spread_bits(cells[:, axis]) for axis in range(3))
+    return x << np.uint64(2) | y << np.uint64(1) | z
+
+
+def _highest_bit(x):
+    """Position of the highest set bit of every nonzero uint64, 0 for zero."""
+    bits = np.zeros(len(x), dtype=np.uint64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        above = (x >> np.uint64(shift)) != 0
+        bits[above] += np.uint64(shift)
+        x = np.where(above, x >> np.uint64(shift), x)
+    return bits
+
+
+class BVH:
+    """Bounding volume hierarchy over a mesh's triangles, stored in flat arrays.
+
+    Node k spans bounds[k] = (min, max). For an inner node, nodes[k, 0] is the
+    index of its first child (the second follows it); for a leaf it is -1 and
+    nodes[k, 1:] are the start and count of its triangles. Triangles are kept
+    as vertex positions in leaf order, with the face each one came from.
+    """
+
+    def __init__(self, bounds, nodes, triangles, faces):
+        self.bounds = bounds
+        self.nodes = nodes
+        self.triangles = triangles
+        self.faces = faces
+
+    @classmethod
+    def build(cls, positions, face_indices, face_offsets, leaf_size=LEAF_SIZE):
+        """Linear BVH over the fan triangulation of packed faces, built a whole tree level at a time.
+
+        Triangles are sorted once by the Morton code of their centroid, so every
+        node is a contiguous range of that order. A range splits where the
+        highest bit its codes differ in flips (at the middle when all its codes
+        are equal), which halves the grid cell the range spans.
+        """
+        tri_corners, tri_faces = triangulate(face_indices, face_offsets)
+        triangles = np.asarray(positions, dtype=np.float32)[face_indices[tri_corners]]
+        if len(triangles) == 0:
+            bounds = np.array([[np.full(3, np.inf), np.full(3, -np.inf)]], dtype=np.float32)
+            return cls(bounds, np.array([(-1, 0, 0)], dtype=np.int32), triangles, tri_faces.astype(np.int32))
+        v0, v1, v2 = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+        codes = morton_codes(v0 + v1 + v2)
+        order = np.argsort(codes, kind='stable')
+        codes = codes[order]
+
+        # Top-down, one level at a time: a level's ranges are disjoint and in order, and get consecutive node ids
+        levels = []
+        starts, ends = np.zeros(1, dtype=np.int64), np.full(1, len(triangles), dtype=np.int64)
+        while len(starts):
+            nodes = np.column_stack([np.full(len(starts), -1), starts, ends - starts])
+            inner = np.flatnonzero(ends - starts > leaf_size)
+            first = sum(len(level) for level in levels) + len(starts)
+            nodes[inner] = np.column_stack([first + 2 * np.arange(len(inner)), np.zeros((len(inner), 2), np.int64)])
+            levels.append(nodes)
+
+            starts, ends = starts[inner], ends[inner]
+            low, high = codes[starts], codes[ends - 1]
+            bit = _highest_bit(low ^ high)
+            splits = np.searchsorted(codes, ((low >> bit) | np.uint64(1)) << bit)
+            same = low == high
+            splits[same] = (starts[same] + ends[same]) // 2
+            starts, ends = np.column_stack([starts, splits]).ravel(), np.column_stack([splits, ends]).ravel()
+        nodes = np.concatenate(levels)
+
+        # Bottom-up bounds: the leaves cover the sorted triangles exactly once, parents merge their two children
+        triangles = triangles[order]
+        v0, v1, v2 = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+        bounds = np.empty((len(nodes), 2, 3), dtype=np.float32)
+        leaves = np.flatnonzero(nodes[:, 0] < 0)
+        leaves = leaves[np.argsort(nodes[leaves, 1])]
+        bounds[leaves, 0] = np.minimum.reduceat(np.minimum(np.minimum(v0, v1), v2), nodes[leaves, 1])
+        bounds[leaves, 1] = np.maximum.reduceat(np.maximum(np.maximum(v0, v1), v2), nodes[leaves, 1])
+        end = len(nodes)
+        for level in reversed(levels):
+            ids = np.arange(end - len(level), end)[level[:, 0] >= 0]
+            children = nodes[ids, 0]
+            bounds[ids, 0] = np.minimum(bounds[children, 0], bounds[children + 1, 0])
+            bounds[ids, 1] = np.maximum(bounds[children, 1], bounds[children + 1, 1])
+            end -= len(level)
+
+        return cls(bounds, nodes.astype(np.int32), triangles, tri_faces[order].astype(np.int32))
+
+    def to_arrays(self):
+        return {'bvh_bounds': self.bounds, 'bvh_nodes': self.nodes,
+                'bvh_triangles': self.triangles, 'bvh_faces': self.faces}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        if 'bvh_nodes' not in arrays:
+            return None
+        return cls(arrays['bvh_bounds'], arrays['bvh_nodes'], arrays['bvh_triangles'], arrays['bvh_faces'])
+
+    def intersect(self, origins, directions, t_max=np.inf, any_hit=False):
+        """Closest hit of every ray, traversing the tree for all rays at once.
+
+        origins and directions are (R, 3); t_max is a scalar or (R,) limit on
+        the hit distance, in units of the direction's length. Returns (face, t)
+        arrays with face -1 and t inf for rays that hit nothing. With any_hit a
+        ray stops at the first hit found, which is enough for occlusion tests.
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        count = len(origins)
+        best_t = np.broadcast_to(np.asarray(t_max, dtype=np.float64), (count,)).copy()
+        best_face = np.full(count, -1, dtype=np.int32)
+        with np.errstate(divide='ignore'):
+            inv_directions = 1.0 / directions
+
+        # Breadth-first: every step tests one (ray, node) pair per row
+        rays = np.arange(count)
+        nodes = np.zeros(count, dtype=np.int64)
+        while len(rays):
+            lows, highs = self.bounds[nodes, 0], self.bounds[nodes, 1]
+            with np.errstate(invalid='ignore'):
+                t0 = (lows - origins[rays]) * inv_directions[rays]
+                t1 = (highs - origins[rays]) * inv_directions[rays]
+            t_near = np.fmax.reduce(np.fmin(t0, t1), axis=1)
+            t_far = np.fmin.reduce(np.fmax(t0, t1), axis=1)
+            hit = (t_near <= t_far) & (t_far >= 0) & (t_near < best_t[rays])
+            rays, nodes = rays[hit], nodes[hit]
+
+            child, start, size = self.nodes[nodes].T
+            leaf = child < 0
+            leaf_rays = np.repeat(rays[leaf], size[leaf])
+            if len(leaf_rays):
+                local = np.arange(len(leaf_rays)) - np.repeat(np.cumsum(size[leaf]) - size[leaf], size[leaf])
+                tris = np.repeat(start[leaf], size[leaf]) + local
+                t = intersect_triangles(origins[leaf_rays], directions[leaf_rays], self.triangles[tris])
+                closer = t < best_t[leaf_rays]
+                leaf_rays, tris, t = leaf_rays[closer], tris[closer], t[closer]
+                np.minimum.at(best_t, leaf_rays, t)
+                winners = t == best_t[leaf_rays]
+                best_face[leaf_rays[winners]] = self.faces[tris[winners]]
+
+            rays, child = rays[~leaf], child[~leaf]
+            if any_hit:
+                pending = best_face[rays] < 0
+                rays, child = rays[pending], child[pending]
+            rays = np.concatenate([rays, rays])
+            nodes = np.concatenate([child, child + 1])
+        best_t[best_face < 0] = np.inf
+        return best_face, best_t
+
+    def occluded(self, origins, directions, t_max):
+        """Whether anything lies on each ray closer than t_max."""
+        return self.intersect(origins, directions, t_max, any_hit=True)[0] >= 0
+
+
+def face_shadows(bvh, positions, face_indices, face_offsets, lights, bias=1e-4):
+    """(L, F) mask of the faces hidden from each light by other geometry.
+
+    One shadow ray per light and face runs from the face center towards the
+    light, in the same (model) space as the BVH, and all of them are traced in
+    a single batch. Rays towards a point light stop just short of it, rays
+    towards a directional light never do. Faces turned away from a light are
+    left to the Lambert term and never reported as shadowed.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    normals = face_normals(positions, face_indices, face_offsets)
+    centers = face_centers(positions, face_indices, face_offsets)
+    to_light, points = light_vectors(lights, centers)
+    light_ids, faces = np.nonzero(np.einsum('lfk,fk->lf', to_light, normals) > 0)
+    shadowed = np.zeros(to_light.shape[:2], dtype=bool)
+    if len(faces):
+        # Start just off the surface
+        origins = centers[faces] + normals[faces] * bias
+        t_max = np.where(points[light_ids], 1.0 - bias, np.inf)
+        shadowed[light_ids, faces] = bvh.occluded(origins, to_light[light_ids, faces], t_max)
+    return shadowed
+
+
+def pick(bvh, camera, pos, width, height):
+    """Face under a screen position and its distance from the eye, or (-1, inf).
+
+    The BVH is in model space, so the ray is built through the inverse of the
+    camera's full model-view-projection matrix.
+    """
+    x, y = pos
+    ndc = np.array([2.0 * x / width - 1, 2.0 * y / height - 1, 1.0, 1.0])
+    far = ndc @ np.linalg.inv(camera.matrix(width / height))
+    eye = camera.get_position() / camera.scale_factor
+    direction = far[:3] / far[3] - eye
+    direction /= np.linalg.norm(direction)
+    faces, distances = bvh.intersect(eye, direction)
+    return int(faces[0]), float(distances[0]) * camera.scale_factor
@@ -0,0 +1,86 @@
+import pygame as pg
+import numpy as np
+from pipeline import rotate_x, rotate_y, translate, scale_matrix, linear, perspective
+
+class Camera:
+    """Orbit camera looking at the origin from `distance` with a perspective lens.
+
+    matrix() composes model (scale_factor), view and projection into the one
+    4x4 matrix the renderer applies to every vertex.
+    """
+
+    def __init__(self):
+        self.angle_pitch = self.angle_yaw = 0
+        self.distance = 5
+        self.fov = 60.0  # Vertical field of view in degrees
+        self.near = 0.1
+        self.far = 100.0
+        self.button = 0  # Mouse button that orbits the camera
+        self.rotation_speed = 0.01
+        self.scale_factor = 1.0  # Scale factor for the cube
+        self.zoom_speed = 0.1    # Speed at which the cube scales
+        self.min_scale = 0.05     # Minimum scale factor
+        self.max_scale = 10.0     # Maximum scale factor
+        self.last_mouse_pos = None
+
+    def control(self):
+        if pg.mouse.get_pressed()[self.button]:
+            mouse_x, mouse_y = pg.mouse.get_pos()
+            if self.last_mouse_pos:
+                dx, dy = mouse_x - self.last_mouse_pos[0], mouse_y - self.last_mouse_pos[1]
+                self.angle_yaw += dx * self.rotation_speed
+                self.angle_pitch -= dy * self.rotation_speed
+            self.last_mouse_pos = (mouse_x, mouse_y)
+        else:
+            self.last_mouse_pos = None
+
+    def state(self):
+        """Everything that affects the rendered view, for change tracking."""
+        return (self.angle_pitch, self.angle_yaw, self.distance, self.scale_factor, self.fov, self.near, self.far)
+
+    def rotation(self):
+        return np.dot(rotate_x(self.angle_pitch), rotate_y(self.angle_yaw))
+
+    def view_matrix(self):
+        return linear(self.rotation()) @ translate((0, 0, self.distance))
+
+    def projection_matrix(self, aspect):
+        return perspective(np.radians(self.fov), aspect, self.near, self.far)
+
+    def view_projection(self, aspect):
+        return self.view_matrix() @ self.projection_matrix(aspect)
+
+    def matrix(self, aspect):
+        """Model-view-projection matrix for row vectors (points @ matrix)."""
+        return scale_matrix(self.scale_factor) @ self.view_projection(aspect)
+
+    def get_position(self):
+        """Eye position in world space."""
+        return -np.dot(self.rotation(), (0, 0, self.distance))
+
+    def zoom_in(self):
+        self.scale_factor = max(self.min_scale, self.scale_factor - self.zoom_speed)
+        #print(f"Zoomed in: New scale factor = {self.scale_factor}")
+
+    def zoom_out(self):
+        self.scale_factor = min(self.max_scale, self.scale_factor + self.zoom_speed)
+        #print(f"Zoomed out: New scale factor = {self.scale_factor}")
+
+    def snapshot(self):
+        """Frozen copy of the view, safe to hand to a render thread while this camera keeps moving."""
+        return CameraSnapshot(self)
+
+
+class CameraSnapshot(Camera):
+    """Read-only copy of a Camera; setting any attribute raises AttributeError."""
+
+    def __init__(self, camera):
+        vars(self).update(vars(camera))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Camera snapshots are read-only, cannot set {name!r}")
+
+    def control(self):
+        raise AttributeError("Camera snapshots are read-only")
+
+    zoom_in = zoom_out = control
@@ -0,0 +1,163 @@
+import copy
+import threading
+import time
+import numpy as np
+import pygame as pg
+from pipeline import transform, to_screen
+
+# Renderer attributes copied into every FrameRequest; 'ssaa_mode' is renderer.ssaa.mode
+RENDER_SETTINGS = ('lighting_enabled', 'ssaa_enabled', 'render_scale', 'zbuffer_enabled', 'culling_enabled',
+                   'shadows_enabled', 'lod_enabled', 'tiles_enabled', 'shading', 'lights', 'ambient_light',
+                   'ssaa_mode')
+
+
+class FrameRequest:
+    """Everything one frame is rendered from, frozen at the moment it was submitted.
+
+    The camera is a CameraSnapshot and the face colors a read-only copy, so
+    input handling and UI callbacks can keep changing the live objects while
+    the worker renders. Mesh arrays are shared, not copied: geometry is treated
+    as immutable once loaded.
+    """
+
+    __slots__ = ('mesh', 'camera', 'colors', 'settings')
+
+    def __init__(self, mesh, camera, colors, settings):
+        self.mesh = mesh
+        self.camera = camera.snapshot()
+        self.colors = np.array(colors, dtype=np.uint8)
+        self.colors.flags.writeable = False
+        self.settings = copy.deepcopy(settings)
+
+    def key(self):
+        """Everything that affects the image, to skip submitting a frame identical to the last one."""
+        settings = tuple(tuple(light.state() for light in value) if name == 'lights' else value
+                         for name, value in self.settings.items())
+        return id(self.mesh), self.camera.state(), self.colors.tobytes(), settings
+
+
+class Frame:
+    """A completed frame: its Surface plus the per-frame data the main thread draws overlays from."""
+
+    def __init__(self, surface, request, renderer, changed, render_time):
+        self.surface = surface
+        self.request = request
+        self.changed = changed  # False when the renderer reused its previous image
+        self.render_time = render_time  # Seconds spent in Renderer.render
+        self.matrix = renderer.matrix
+        self.visible, self.normals, self.centers = renderer.visible, renderer.normals, renderer.centers
+        self.cull_stats = str(renderer.cull_stats)
+
+    def project(self, points):
+        """Screen positions of model-space points in this frame's view, and which lie in front of the eye."""
+        clip = transform(points, self.matrix)
+        width, height = self.surface.get_size()
+        screen_points, _ = to_screen(clip, width, height)
+        return screen_points, clip[:, 3] > 0
+
+
+class FramePipeline:
+    """Renders frame N + 1 on a worker thread while the main thread presents frame N.
+
+    submit() hands over a FrameRequest; a request not yet started is replaced
+    by a newer one, so the worker always renders the latest input. The worker
+    owns the Renderer and a back buffer: it copies each finished frame there
+    and, under the lock, publishes it. acquire() swaps the back and front
+    buffers and returns the new front Frame, which the worker never touches, so
+    the main thread can blit it, draw overlays and flip while the next frame
+    renders.
+    """
+
+    def __init__(self, renderer):
+        self.renderer = renderer
+        size = (renderer.width, renderer.height)
+        self._front, self._back = pg.Surface(size), pg.Surface(size)
+        self._lock = threading.Condition()
+        # Renderer attributes as they were when the pipeline took the renderer over; only the worker touches it now
+        self.defaults = {name: renderer.ssaa.mode if name == 'ssaa_mode' else getattr(renderer, name)
+                         for name in RENDER_SETTINGS}
+        self._request = None
+        self._last_key = None
+        self._ready = None
+        self._busy = False
+        self._running = True
+        self._error = None
+        self._thread = threading.Thread(target=self._work, name='render', daemon=True)
+        self._thread.start()
+
+    def submit(self, mesh, camera, colors, **settings):
+        """Queue a frame of mesh seen by camera, with settings overriding `defaults` from RENDER_SETTINGS.
+
+        Returns False, queueing nothing, when the request matches the last one submitted.
+        """
+        unknown = set(settings) - set(RENDER_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown render settings {sorted(unknown)}, expected some of {RENDER_SETTINGS}")
+        request = FrameRequest(mesh, camera, colors, {**self.defaults, **settings})
+        key = request.key()
+        if key == self._last_key:
+            return False
+        self._last_key = key
+        with self._lock:
+            self._request = request
+            self._lock.notify_all()
+        return True
+
+    @property
+    def idle(self):
+        """True when no frame is queued, rendering or waiting to be acquired."""
+        with self._lock:
+            return self._request is None and not self._busy and self._ready is None
+
+    def acquire(self):
+        """The newest completed Frame, swapped to the front buffer, or None when none finished since the last call."""
+        with self._lock:
+            if self._error is not None:
+                raise RuntimeError("Render worker failed") from self._error
+            frame, self._ready = self._ready, None
+            if frame is not None:
+                self._front, self._back = self._back, self._front
+        return frame
+
+    def wait(self, timeout=None):
+        """Block until a completed frame is ready to acquire, or the timeout in seconds runs out."""
+        with self._lock:
+            return self._lock.wait_for(lambda: self._ready is not None or self._error is not None, timeout)
+
+    def close(self):
+        """Stop the worker thread and the renderer's tile workers."""
+        with self._lock:
+            self._running = False
+            self._lock.notify_all()
+        self._thread.join()
+        self.renderer.close()
+
+    def _work(self):
+        renderer = self.renderer
+        while True:
+            with self._lock:
+                self._lock.wait_for(lambda: self._request is not None or not self._running)
+                if not self._running:
+                    return
+                request, self._request = self._request, None
+                self._busy = True
+            try:
+                for name, value in request.settings.items():
+                    if name == 'ssaa_mode':
+                        renderer.ssaa.mode = value
+                    else:
+                        setattr(renderer, name, value)
+                start = time.perf_counter()
+                surface = renderer.render(request.mesh, request.camera, request.colors)
+                render_time = time.perf_counter() - start
+            except Exception as error:
+                with self._lock:
+                    self._error, self._busy, self._running = error, False, False
+                    self._lock.notify_all()
+                return
+            with self._lock:
+                # The back buffer is never on screen, so it can be written while the front is presented
+                self._back.blit(surface, (0, 0))
+                self._ready = Frame(self._back, request, renderer, renderer.frame_changed, render_time)
+                self._busy = False
+                self._lock.notify_all()
@@ -0,0 +1,93 @@
+import numpy as np
+
+LIGHT_KINDS = ('point', 'directional')
+
+
+class Light:
+    """A point light at `vector`, or a directional light shining along `vector`.
+
+    intensity scales the light's diffuse and specular contribution.
+    attenuation is the (constant, linear, quadratic) distance falloff of a
+    point light, 1 / (c + l * d + q * d^2); None keeps it constant.
+    """
+
+    def __init__(self, vector, intensity=0.8, kind='point', attenuation=None):
+        if kind not in LIGHT_KINDS:
+            raise ValueError(f"Unknown light kind {kind!r}, expected one of {LIGHT_KINDS}")
+        self.vector = np.asarray(vector, dtype=np.float64)
+        self.intensity = intensity
+        self.kind = kind
+        self.attenuation = attenuation
+
+    def state(self):
+        """Everything that affects the lit image, for change tracking."""
+        return (self.kind, tuple(self.vector.tolist()), self.intensity,
+                tuple(self.attenuation) if self.attenuation is not None else None)
+
+
+def point_light(position, intensity=0.8, attenuation=None):
+    return Light(position, intensity, 'point', attenuation)
+
+
+def directional_light(direction, intensity=0.8):
+    return Light(direction, intensity, 'directional')
+
+
+def pack_lights(lights):
+    """Stack a light list into (L, 3) vectors, an (L,) point-light mask, (L,) intensities and (L, 3) attenuation."""
+    vectors = np.array([light.vector for light in lights], dtype=np.float64).reshape(-1, 3)
+    points = np.array([light.kind == 'point' for light in lights], dtype=bool)
+    intensities = np.array([light.intensity for light in lights], dtype=np.float64)
+    attenuation = np.array([light.attenuation if light.attenuation is not None else (1.0, 0.0, 0.0)
+                            for light in lights], dtype=np.float64).reshape(-1, 3)
+    return vectors, points, intensities, attenuation
+
+
+def light_vectors(lights, positions):
+    """(L, N, 3) vectors from every point to every light, and the (L,) point-light mask.
+
+    For point lights the vector reaches the light, so its length is the
+    distance; for directional lights it is the reversed light direction.
+    """
+    vectors, points, _, _ = pack_lights(lights)
+    positions = np.asarray(positions, dtype=np.float64)
+    to_light = np.where(points[:, None, None], vectors[:, None, :] - positions, -vectors[:, None, :])
+    return to_light, points
+
+
+def illuminate(lights, normals, positions, ambient_light, eye_pos=None, specular_light=0.0, shininess=32,
+               shadowed=None):
+    """Lighting at N points from every light, evaluated as one (L, N) broadcast.
+
+    Returns the ambient plus Lambert diffuse intensity, and the Blinn-Phong
+    specular term (None without an eye position) to be added as a white
+    highlight. Normals need not be unit length. shadowed is an optional
+    (L, N) mask of points hidden from each light.
+    """
+    normals = np.array(normals, dtype=np.float64)
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    np.divide(normals, lengths, out=normals, where=lengths > 0)
+    positions = np.asarray(positions, dtype=np.float64)
+    _, points, intensities, attenuation = pack_lights(lights)
+
+    directions, _ = light_vectors(lights, positions)
+    distances = np.linalg.norm(directions, axis=2)
+    directions /= np.maximum(distances, 1e-12)[..., None]
+    c, l, q = attenuation.T[..., None]
+    falloff = np.where(points[:, None], 1.0 / (c + l * distances + q * distances ** 2), 1.0)
+    strength = intensities[:, None] * falloff
+    if shadowed is not None:
+        strength = np.where(shadowed, 0.0, strength)
+
+    dots = np.einsum('lnk,nk->ln', directions, normals)
+    intensity = ambient_light + (np.maximum(dots, 0) * strength).sum(axis=0)
+    if eye_pos is None:
+        return intensity, None
+
+    view = np.asarray(eye_pos, dtype=np.float64) - positions
+    view /= np.maximum(np.linalg.norm(view, axis=1, keepdims=True), 1e-12)
+    halfway = directions + view
+    halfway /= np.maximum(np.linalg.norm(halfway, axis=2, keepdims=True), 1e-12)
+    highlights = np.maximum(np.einsum('lnk,nk->ln', halfway, normals), 0) ** shininess
+    specular = (np.where(dots > 0, highlights, 0.0) * strength).sum(axis=0) * specular_light
+    return intensity, specular
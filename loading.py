@@ -0,0 +1,153 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from mesh import Mesh
+from obj_loader import load_mesh
+from pipeline import select_faces
+
+LOAD_WORKERS = 4  # Meshes parsed at the same time; NumPy tokenizing releases the GIL for most of the work
+DERIVE_WORKERS = 2  # Processes building edges, BVHs and LODs, which would otherwise hold the GIL for seconds
+PARTIAL_UPDATES = 16  # Blocks an uncached OBJ file is split into, each one a partial mesh for display
+MIN_BLOCK_SIZE = 1 << 16
+
+_executor = _derive_executor = None
+_executor_lock = threading.Lock()
+
+
+def _shared_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(LOAD_WORKERS, thread_name_prefix='mesh-loader')
+        return _executor
+
+
+def _shared_derive_executor():
+    global _derive_executor
+    with _executor_lock:
+        if _derive_executor is None:
+            # Forking this multithreaded process could hand a worker a lock some other thread holds
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _derive_executor = ProcessPoolExecutor(DERIVE_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _derive_executor
+
+
+def _discard_derive_executor(executor):
+    """Drop a broken derive pool, so the next load starts a fresh one."""
+    global _derive_executor
+    with _executor_lock:
+        if _derive_executor is executor:
+            _derive_executor = None
+    executor.shutdown(wait=False)
+
+
+class MeshLoad:
+    """Handle to a mesh loading in the background, returned at once by load_async.
+
+    While an uncached file is parsed, partial() is the geometry read so far and
+    bounds its axis-aligned box, both centered the way the finished mesh will
+    be (on the mean of the vertices read so far). progress is the fraction of
+    the file read. Once done, mesh is the finished mesh.Mesh, or error the
+    exception that stopped the load.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.progress = 0.0
+        self.mesh = None
+        self.error = None
+        self._partial = self._bounds = None
+        self._lock = threading.Lock()
+        self._future = None
+
+    @property
+    def done(self):
+        return self._future is not None and self._future.done()
+
+    def partial(self):
+        """The Mesh parsed so far, its faces limited to vertices already read, or None before the first block."""
+        with self._lock:
+            return self.mesh if self.mesh is not None else self._partial
+
+    @property
+    def bounds(self):
+        """(min corner, max corner) of the geometry read so far, or None before any vertex arrived."""
+        with self._lock:
+            return self._bounds
+
+    def result(self, timeout=None):
+        """Block until the load finishes and return the mesh, raising its error if it failed."""
+        return self._future.result(timeout)
+
+    def _on_block(self, fraction, mesh):
+        # The partial mesh's arrays are views of the parser's outputs, so center a copy
+        if len(mesh.positions):
+            mesh.positions = mesh.positions - mesh.positions.mean(axis=0, dtype=np.float64).astype(np.float32)
+        # Faces may only reference vertices parsed in a later block; drop them until those arrive
+        if mesh.face_count:
+            complete = np.maximum.reduceat(mesh.face_indices, mesh.face_offsets[:-1]) < len(mesh.positions)
+            if not complete.all():
+                mesh = Mesh(mesh.positions, *select_faces(mesh.face_indices, mesh.face_offsets,
+                                                          np.flatnonzero(complete)))
+        bounds = _bounds(mesh.positions)
+        with self._lock:
+            self._partial, self._bounds, self.progress = mesh, bounds, fraction
+
+    def _load(self, use_cache):
+        try:
+            chunk_size = max(os.path.getsize(self.filename) // PARTIAL_UPDATES, MIN_BLOCK_SIZE)
+            executor = _shared_derive_executor()
+            try:
+                mesh = load_mesh(self.filename, use_cache, chunk_size, self._on_block, executor)
+            except BrokenProcessPool as error:
+                _discard_derive_executor(executor)
+                print(f"Derive worker died loading {self.filename} ({error}), loading again in this thread")
+                mesh = load_mesh(self.filename, use_cache, chunk_size, self._on_block)
+        except Exception as error:
+            self.error = error
+            print(f"Failed to load {self.filename}: {error}")
+            raise
+        bounds = _bounds(mesh.positions)
+        with self._lock:
+            self.mesh, self._partial, self._bounds, self.progress = mesh, None, bounds, 1.0
+        return mesh
+
+
+def box_lines(bounds):
+    """(12, 2, 3) endpoints of the edges of the box between bounds' min and max corners."""
+    lo, hi = bounds
+    bits = (np.arange(8)[:, None] >> np.arange(3)) & 1
+    corners = np.where(bits, hi, lo)
+    # Corners differing in exactly one bit share an edge
+    edges = [(i, i | bit) for i in range(8) for bit in (1, 2, 4) if not i & bit]
+    return corners[np.array(edges)]
+
+
+def _bounds(positions):
+    return (positions.min(axis=0), positions.max(axis=0)) if len(positions) else None
+
+
+def load_async(filename, use_cache=True, executor=None):
+    """Start loading an OBJ file through obj_loader.load_mesh and return its MeshLoad handle right away.
+
+    Loads run on a shared pool of LOAD_WORKERS threads unless an executor is
+    given, so several files started together load concurrently. Parsing stays
+    on the thread, to stream partial geometry; the edges, BVH and LODs are then
+    built on a shared pool of DERIVE_WORKERS forkserver (or spawn) processes,
+    so the caller's threads keep the GIL. Those workers import the __main__
+    module, so scripts must keep their side effects under
+    `if __name__ == '__main__'`. If a worker dies, the pool is replaced and
+    that file is loaded again entirely in its thread. A file with a valid
+    compiled cache skips parsing and has no partial geometry.
+    """
+    handle = MeshLoad(filename)
+    handle._future = (executor or _shared_executor()).submit(handle._load, use_cache)
+    return handle
+
+
+def load_all(filenames, use_cache=True):
+    """Start loading every file at once; MeshLoad handles in the same order."""
+    return [load_async(filename, use_cache) for filename in filenames]
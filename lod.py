@@ -0,0 +1,183 @@
+import numpy as np
+from mesh import Mesh
+from pipeline import next_corners, select_faces, normalize, build_edges
+
+LOD_LEVELS = 3  # Simplified levels built below the full-detail mesh
+LOD_RESOLUTION = 64  # Grid cells along the bounding-box diagonal for the first simplified level
+FULL_DETAIL_PIXELS = 300  # Projected diameter below which simplification starts
+MORPH_BAND = 0.3  # Fraction of each level's size range spent morphing into the next level
+MORPH_HOLD = 0.01  # Fraction at the end of the range held fully morphed, so the switch itself changes nothing
+
+
+class LevelOfDetail:
+    """One level of a mesh: vertex positions and normals, packed faces and, per face, the source face of the full mesh.
+
+    parents maps every vertex to the vertex of the next coarser level it was
+    merged into (None on the coarsest level), which is what lets a level morph
+    smoothly into the next.
+    """
+
+    def __init__(self, positions, face_indices, face_offsets, source_faces, parents=None, normals=None):
+        self.positions = positions
+        self.normals = normals
+        self.face_indices = face_indices
+        self.face_offsets = face_offsets
+        self.source_faces = source_faces
+        self.parents = parents
+
+    @property
+    def face_count(self):
+        return len(self.face_offsets) - 1
+
+
+def cluster_vertices(level, origin, cell_size):
+    """Simplify a level by merging all vertices that fall in the same grid cell.
+
+    Sets level.parents and returns the coarser LevelOfDetail, whose positions
+    and normals are the means of the merged vertices. Faces left with fewer
+    than three distinct corners are dropped. The others keep every corner,
+    even those collapsed onto their neighbour, so per-face means such as
+    centers and depths match the fully morphed finer level exactly.
+    """
+    cells = np.floor((level.positions - origin) / cell_size).astype(np.int64)
+    _, parents = np.unique(cells, axis=0, return_inverse=True)
+    parents = parents.reshape(-1).astype(np.int32)
+    counts = np.bincount(parents).astype(np.float64)
+    positions = np.zeros((len(counts), 3))
+    np.add.at(positions, parents, level.positions)
+    positions /= counts[:, None]
+    normals = None
+    if level.normals is not None:
+        normals = np.zeros((len(counts), 3))
+        np.add.at(normals, parents, level.normals)
+        normals = normalize(normals).astype(level.normals.dtype)
+
+    corners = parents[level.face_indices]
+    distinct = corners != corners[next_corners(level.face_indices, level.face_offsets)]
+    faces = np.flatnonzero(np.add.reduceat(distinct.astype(np.int32), level.face_offsets[:-1]) >= 3)
+    face_indices, face_offsets = select_faces(corners, level.face_offsets, faces)
+
+    level.parents = parents
+    return LevelOfDetail(positions.astype(level.positions.dtype), face_indices, face_offsets,
+                         level.source_faces[faces], normals=normals)
+
+
+def build_lods(positions, face_indices, face_offsets, normals=None, levels=LOD_LEVELS, resolution=LOD_RESOLUTION):
+    """Full-detail level plus `levels` vertex-clustered levels, each on a grid twice as coarse.
+
+    Grids share one origin, so cells nest and every level's vertices merge
+    cleanly into the next.
+    """
+    full = LevelOfDetail(positions, face_indices, face_offsets,
+                         np.arange(len(face_offsets) - 1, dtype=np.int32), normals=normals)
+    result = [full]
+    if len(positions) == 0:
+        return result
+    origin = positions.min(axis=0)
+    cell_size = np.linalg.norm(np.ptp(positions, axis=0)) / resolution
+    for _ in range(levels):
+        result.append(cluster_vertices(result[-1], origin, cell_size))
+        cell_size *= 2
+    return result
+
+
+def lods_to_arrays(lods):
+    """Flat arrays for the mesh cache; the full-detail mesh itself is stored elsewhere."""
+    arrays = {'lod_count': np.array(len(lods))}
+    if len(lods) > 1:
+        arrays['lod0_parents'] = lods[0].parents
+    for k, level in enumerate(lods[1:], 1):
+        arrays[f'lod{k}_positions'] = level.positions
+        arrays[f'lod{k}_face_indices'] = level.face_indices
+        arrays[f'lod{k}_face_offsets'] = level.face_offsets
+        arrays[f'lod{k}_source_faces'] = level.source_faces
+        if level.normals is not None:
+            arrays[f'lod{k}_normals'] = level.normals
+        if level.parents is not None:
+            arrays[f'lod{k}_parents'] = level.parents
+    return arrays
+
+
+def lods_from_arrays(positions, face_indices, face_offsets, normals, arrays):
+    if 'lod_count' not in arrays:
+        return None
+    count = int(arrays['lod_count'])
+    lods = [LevelOfDetail(positions, face_indices, face_offsets,
+                          np.arange(len(face_offsets) - 1, dtype=np.int32), arrays.get('lod0_parents'), normals)]
+    for k in range(1, count):
+        lods.append(LevelOfDetail(arrays[f'lod{k}_positions'], arrays[f'lod{k}_face_indices'],
+                                  arrays[f'lod{k}_face_offsets'], arrays[f'lod{k}_source_faces'],
+                                  arrays.get(f'lod{k}_parents'), arrays.get(f'lod{k}_normals')))
+    return lods
+
+
+class LODSelector:
+    """Picks a level of a mesh each frame from its projected size on screen.
+
+    Every halving of the projected diameter below full_detail_pixels moves one
+    level down. In the last morph_band of a level's range its vertices slide
+    towards their parents, reaching them morph_hold before the coarser level
+    takes over, so the switch draws exactly the same pixels and nothing pops.
+    """
+
+    def __init__(self, mesh, full_detail_pixels=FULL_DETAIL_PIXELS, morph_band=MORPH_BAND, morph_hold=MORPH_HOLD):
+        self.mesh = mesh
+        self.lods = mesh.lods
+        self.full_detail_pixels = full_detail_pixels
+        self.morph_band = morph_band
+        self.morph_hold = morph_hold
+        self.radius = float(np.linalg.norm(mesh.positions, axis=1).max()) if len(mesh.positions) else 0.0
+        self.level, self.morph = 0, 0.0
+        self._meshes = {0: mesh}  # Unmorphed levels, kept so their array ids stay stable for change tracking
+
+    def screen_size(self, camera, height, matrix=None):
+        """Projected diameter in pixels of the mesh's bounding sphere, placed by a model matrix or at the origin."""
+        focal = height / 2 / np.tan(np.radians(camera.fov) / 2)
+        if matrix is None:
+            radius, distance = self.radius, camera.distance
+        else:
+            # The sphere moves with the translation and grows with the largest axis scale
+            radius = self.radius * np.linalg.norm(matrix[:3, :3], axis=1).max()
+            distance = np.linalg.norm(camera.get_position() / camera.scale_factor - matrix[3, :3]) * camera.scale_factor
+        radius *= camera.scale_factor
+        return 2 * radius * focal / max(distance - radius, camera.near)
+
+    def select(self, camera, height, matrix=None):
+        """(Mesh, source_faces) to render this frame, with the level picked for a viewport `height` pixels tall.
+
+        At full detail the Mesh is the mesh itself, BVH and all. source_faces
+        maps every face of the level to its face in the full mesh, e.g. to look
+        up face colors.
+        """
+        size = self.screen_size(camera, height, matrix)
+        steps = np.log2(self.full_detail_pixels / size) if size > 0 else len(self.lods) - 1
+        steps = float(np.clip(steps, 0, len(self.lods) - 1))
+        self.level = min(int(steps), len(self.lods) - 1)
+        level = self.lods[self.level]
+        self.morph = 0.0
+        if self.level + 1 < len(self.lods):
+            band = self.morph_band - self.morph_hold
+            self.morph = float(np.clip((steps - self.level - (1 - self.morph_band)) / band, 0, 1))
+        mesh = self._level_mesh(self.level)
+        if self.morph > 0:
+            coarser = self.lods[self.level + 1]
+            targets = coarser.positions[level.parents]
+            # Weighted this way, a full morph lands exactly on the parents, bit for bit
+            positions = level.positions * np.float32(1 - self.morph) + targets * np.float32(self.morph)
+            normals = level.normals
+            if normals is not None and coarser.normals is not None:
+                # Blended normals are renormalized by the lighting
+                normals = normals * np.float32(1 - self.morph) + coarser.normals[level.parents] * np.float32(self.morph)
+            morphed = Mesh(positions, level.face_indices, level.face_offsets)
+            morphed.vertex_normals, morphed.edges = normals, mesh.edges
+            mesh = morphed
+        return mesh, level.source_faces
+
+    def _level_mesh(self, k):
+        if k not in self._meshes:
+            level = self.lods[k]
+            mesh = Mesh(level.positions, level.face_indices, level.face_offsets)
+            mesh.vertex_normals = level.normals
+            mesh.edges = build_edges(level.face_indices, level.face_offsets)
+            self._meshes[k] = mesh
+        return self._meshes[k]
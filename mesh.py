@@ -0,0 +1,89 @@
+import numpy as np
+from pipeline import pack_faces
+
+
+class Mesh:
+    """Polygon mesh held in contiguous typed arrays, shared by every loader and renderer.
+
+    positions is (N, 3) float32. Faces are packed as int32 corner indices plus
+    offsets, so face k is face_indices[face_offsets[k]:face_offsets[k + 1]]
+    and n-gons need no padding. texcoords and normals are indexed per corner
+    by face_texcoords and face_normals, with -1 marking a corner without one.
+    colors is an optional (F, 3) uint8 color per face. `groups` holds
+    (face_start, face_end, object, group, material) ranges.
+
+    `edges` (unique (E, 2) edges), `bvh` (ray-query index), `vertex_normals`
+    (one unit normal per position, for smooth shading) and `lods` (simplified
+    levels) are derived data, filled in by obj_loader.load_mesh.
+    """
+
+    __slots__ = ('positions', 'texcoords', 'normals', 'face_indices', 'face_texcoords', 'face_normals',
+                 'face_offsets', 'colors', 'groups', 'mtllibs', 'edges', 'bvh', 'vertex_normals', 'lods')
+
+    def __init__(self, positions, face_indices, face_offsets, texcoords=None, normals=None, face_texcoords=None,
+                 face_normals=None, colors=None, groups=(), mtllibs=()):
+        self.positions = np.ascontiguousarray(positions, dtype=np.float32)
+        self.face_indices = np.ascontiguousarray(face_indices, dtype=np.int32)
+        self.face_offsets = np.ascontiguousarray(face_offsets, dtype=np.int32)
+        self.texcoords = np.zeros((0, 2), dtype=np.float32) if texcoords is None else texcoords
+        self.normals = np.zeros((0, 3), dtype=np.float32) if normals is None else normals
+        missing = np.full(len(self.face_indices), -1, dtype=np.int32)
+        self.face_texcoords = missing if face_texcoords is None else face_texcoords
+        self.face_normals = missing if face_normals is None else face_normals
+        self.colors = None if colors is None else np.ascontiguousarray(colors, dtype=np.uint8)
+        self.groups = list(groups)
+        self.mtllibs = list(mtllibs)
+        self.edges = None
+        self.bvh = None
+        self.vertex_normals = None
+        self.lods = None
+
+    @classmethod
+    def from_faces(cls, positions, faces, colors=None, texcoords=None):
+        """Mesh from a list of polygon index lists, with optional per-face lists of corner texcoords."""
+        face_indices, face_offsets = pack_faces(faces)
+        face_texcoords = None
+        if texcoords is not None:
+            texcoords = np.array([uv for face in texcoords for uv in face], dtype=np.float32).reshape(-1, 2)
+            face_texcoords = np.arange(len(texcoords), dtype=np.int32)
+        return cls(positions, face_indices, face_offsets, texcoords, face_texcoords=face_texcoords, colors=colors)
+
+    @property
+    def face_count(self):
+        return len(self.face_offsets) - 1
+
+    def submesh(self, group):
+        """Faces of one object/material group, sharing this mesh's vertex arrays."""
+        face_start, face_end = self.groups[group][:2]
+        lo, hi = self.face_offsets[face_start], self.face_offsets[face_end]
+        return Mesh(self.positions, self.face_indices[lo:hi], self.face_offsets[face_start:face_end + 1] - lo,
+                    self.texcoords, self.normals, self.face_texcoords[lo:hi], self.face_normals[lo:hi],
+                    self.colors[face_start:face_end] if self.colors is not None else None,
+                    [(0, face_end - face_start) + tuple(self.groups[group][2:])], self.mtllibs)
+
+    def to_arrays(self):
+        names = np.array([group[2:] for group in self.groups], dtype=str).reshape(-1, 3)
+        ranges = np.array([group[:2] for group in self.groups], dtype=np.int32).reshape(-1, 2)
+        arrays = {
+            'positions': self.positions,
+            'texcoords': self.texcoords,
+            'normals': self.normals,
+            'face_indices': self.face_indices,
+            'face_texcoords': self.face_texcoords,
+            'face_normals': self.face_normals,
+            'face_offsets': self.face_offsets,
+            'group_ranges': ranges,
+            'group_names': names,
+            'mtllibs': np.array(self.mtllibs, dtype=str),
+        }
+        if self.colors is not None:
+            arrays['colors'] = self.colors
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        groups = [tuple(int(i) for i in r) + tuple(str(n) for n in names)
+                  for r, names in zip(arrays['group_ranges'], arrays['group_names'])]
+        return cls(arrays['positions'], arrays['face_indices'], arrays['face_offsets'], arrays['texcoords'],
+                   arrays['normals'], arrays['face_texcoords'], arrays['face_normals'], arrays.get('colors'),
+                   groups, [str(name) for name in arrays['mtllibs']])
@@ -1,39 +1,335 @@
+import os
+import tempfile
+import zipfile
 import numpy as np
+from bvh import BVH
+from mesh import Mesh
+from pipeline import normalize, vertex_normals, build_edges
+from lod import build_lods, lods_to_arrays, lods_from_arrays
 
-def parse_vertex(line):
-    return list(map(float, line.split()[1:]))
+CACHE_VERSION = 7
+CACHE_SUFFIX = '.cache.npz'
+CHUNK_SIZE = 1 << 22  # Bytes read from the OBJ file per parsing step; bounds the parser's temporaries
 
-def parse_face(line):
-    face_parts = line.split()[1:]
-    vertices = []
-    for part in face_parts:
-        vertex_index = part.split('/')[0]
-        vertices.append(int(vertex_index) - 1)
-    return vertices
+_SPACE, _NEWLINE, _SLASH, _HASH = ord(' '), ord('\n'), ord('/'), ord('#')
 
-def load_obj(filename):
-    vertices = []
-    faces = []
+def _read_chunks(file, chunk_size):
+    """Yield blocks of whole lines from a binary file."""
+    tail = b''
+    while True:
+        block = file.read(chunk_size)
+        if not block:
+            break
+        block = tail + block
+        cut = block.rfind(b'\n') + 1
+        tail = block[cut:]
+        if cut:
+            yield block[:cut]
+    if tail:
+        yield tail + b'\n'
+
+def _line_text(data, starts, ends, skip):
+    """Bytes of the selected lines with their keyword removed, newlines kept as separators."""
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    # A +1/-1 marker at both ends of every line, summed into a one-byte-per-byte mask instead of gather indices
+    marks = np.zeros(len(data) + 1, dtype=np.int8)
+    marks[starts + skip] = 1
+    marks[ends + 1] = -1
+    return data[np.cumsum(marks[:-1], dtype=np.int8).view(bool)]
+
+def _tokens_per_line(text):
+    """Whitespace separated token count of every newline terminated line in text."""
+    blank = (text == _SPACE) | (text == _NEWLINE)
+    line_ids = np.cumsum(text == _NEWLINE, dtype=np.int32)
+    line_ids -= text == _NEWLINE
+    token_starts = ~blank
+    token_starts[1:] &= blank[:-1]
+    return np.bincount(line_ids[token_starts], minlength=int(line_ids[-1]) + 1 if len(text) else 0), line_ids
+
+def _parse_records(text, columns, dtype):
+    """Parse numeric records into an (n, columns) array, zero filling short records."""
+    if len(text) == 0:
+        return np.zeros((0, columns), dtype=dtype)
+    counts, _ = _tokens_per_line(text)
+    values = np.fromstring(text.tobytes(), dtype=dtype, sep=' ')
+    firsts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    records = np.zeros((len(counts), columns), dtype=dtype)
+    for column in range(columns):
+        present = counts > column
+        records[present, column] = values[firsts[present] + column]
+    return records
+
+def _resolve(indices, totals):
+    """Turn one-based or negative OBJ indices into zero-based ones, -1 where missing."""
+    return np.where(indices > 0, indices - 1, np.where(indices < 0, totals + indices, -1)).astype(np.int32)
+
+def _parse_faces(text, v_totals, vt_totals, vn_totals):
+    text = np.frombuffer(text.tobytes().replace(b'//', b'/0/'), dtype=np.uint8)
+    arity, line_ids = _tokens_per_line(text)
+    slashes = np.bincount(line_ids[text == _SLASH], minlength=len(arity))
+    components = np.repeat(slashes // np.maximum(arity, 1) + 1, arity)
+    values = np.fromstring(np.where(text == _SLASH, _SPACE, text).astype(np.uint8).tobytes(), dtype=np.int64, sep=' ')
+    firsts = np.concatenate(([0], np.cumsum(components)[:-1]))
+    last = len(values) - 1
+    positions = values[firsts]
+    texcoords = np.where(components > 1, values[np.minimum(firsts + 1, last)], 0)
+    normals = np.where(components > 2, values[np.minimum(firsts + 2, last)], 0)
+    return (arity,
+            _resolve(positions, np.repeat(v_totals, arity)),
+            _resolve(texcoords, np.repeat(vt_totals, arity)),
+            _resolve(normals, np.repeat(vn_totals, arity)))
+
+def _scan(block):
+    """Bytes of a block of whole lines, each line's start and end, and masks of the v, vt, vn and f lines.
+
+    Comments are blanked out and line starts skip leading blanks, so indented
+    records and records followed by a comment parse like any other.
+    """
+    block = block.replace(b'\r', b' ').replace(b'\t', b' ')
+    data = np.frombuffer(block + b'  ', dtype=np.uint8)
+    ends = np.flatnonzero(data == _NEWLINE)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    hashes = np.flatnonzero(data == _HASH)
+    if len(hashes):
+        # Blank from the first # of every line up to its newline, with the same +1/-1 mask as _line_text
+        lines, first = np.unique(np.searchsorted(ends, hashes), return_index=True)
+        marks = np.zeros(len(data) + 1, dtype=np.int8)
+        marks[hashes[first]] = 1
+        marks[ends[lines]] = -1
+        data = np.where(np.cumsum(marks[:-1], dtype=np.int8).view(bool), np.uint8(_SPACE), data)
+    # Step the starts of indented lines past their blanks, one column at a time; newlines stop them
+    indented = np.flatnonzero(data[starts] == _SPACE)
+    while len(indented):
+        starts[indented] += 1
+        indented = indented[data[starts[indented]] == _SPACE]
+    b0, b1, b2 = data[starts], data[starts + 1], data[starts + 2]
+    kinds = {
+        'v': (b0 == ord('v')) & (b1 == _SPACE),
+        'vt': (b0 == ord('v')) & (b1 == ord('t')) & (b2 == _SPACE),
+        'vn': (b0 == ord('v')) & (b1 == ord('n')) & (b2 == _SPACE),
+        'f': (b0 == ord('f')) & (b1 == _SPACE),
+    }
+    return data, starts, ends, kinds
+
+def _count_records(filename, chunk_size):
+    """Number of v, vt, vn and f records and of face corners in an OBJ file, to size the output arrays."""
+    counts = dict.fromkeys(('v', 'vt', 'vn', 'f', 'corners'), 0)
+    with open(filename, 'rb') as file:
+        for block in _read_chunks(file, chunk_size):
+            data, starts, ends, kinds = _scan(block)
+            for name, lines in kinds.items():
+                counts[name] += int(np.count_nonzero(lines))
+            text = _line_text(data, starts[kinds['f']], ends[kinds['f']], 2)
+            if len(text):
+                blank = (text == _SPACE) | (text == _NEWLINE)
+                counts['corners'] += int(np.count_nonzero(~blank[1:] & blank[:-1])) + (not blank[0])
+    return counts
+
+def read_obj(filename, chunk_size=CHUNK_SIZE, on_block=None):
+    """Parse an OBJ file into a Mesh, tokenizing blocks of records with NumPy.
+
+    Only object, group, material and mtllib lines are handled one at a time.
+    A first pass counts the records, so every block is parsed straight into
+    preallocated output arrays: peak memory is the result plus the
+    temporaries of one block (a few dozen bytes per byte of chunk_size).
+    on_block, if given, is called after every block with the fraction of the
+    file read and a Mesh of everything parsed so far, without groups. Its
+    arrays are views of the outputs still being filled, so copy before changing them.
+    """
+    counts = _count_records(filename, chunk_size)
+    positions = np.zeros((counts['v'], 3), dtype=np.float32)
+    texcoords = np.zeros((counts['vt'], 2), dtype=np.float32)
+    normals = np.zeros((counts['vn'], 3), dtype=np.float32)
+    face_indices = np.zeros(counts['corners'], dtype=np.int32)
+    face_texcoords = np.zeros(counts['corners'], dtype=np.int32)
+    face_normals = np.zeros(counts['corners'], dtype=np.int32)
+    face_offsets = np.zeros(counts['f'] + 1, dtype=np.int32)
+
+    totals = {'v': 0, 'vt': 0, 'vn': 0, 'f': 0, 'corners': 0}
+    state = {'o': '', 'g': '', 'usemtl': ''}
+    group_starts = [(0, '', '', '')]
+    mtllibs = []
+
+    def parsed(groups=(), mtllibs=()):
+        corners = totals['corners']
+        return Mesh(positions[:totals['v']], face_indices[:corners], face_offsets[:totals['f'] + 1],
+                    texcoords[:totals['vt']], normals[:totals['vn']], face_texcoords[:corners],
+                    face_normals[:corners], groups=groups, mtllibs=mtllibs)
+
+    with open(filename, 'rb') as file:
+        size = max(os.fstat(file.fileno()).st_size, 1)
+        for block in _read_chunks(file, chunk_size):
+            data, starts, ends, kinds = _scan(block)
+            for name, out, skip in (('v', positions, 2), ('vt', texcoords, 3), ('vn', normals, 3)):
+                lines = kinds[name]
+                records = _parse_records(_line_text(data, starts[lines], ends[lines], skip), out.shape[1], out.dtype)
+                out[totals[name]:totals[name] + len(records)] = records
+
+            is_f = kinds['f']
+            v_before = totals['v'] + np.cumsum(kinds['v'])
+            vt_before = totals['vt'] + np.cumsum(kinds['vt'])
+            vn_before = totals['vn'] + np.cumsum(kinds['vn'])
+            f_before = totals['f'] + np.cumsum(is_f) - is_f
+            if is_f.any():
+                arity, faces, corner_texcoords, corner_normals = _parse_faces(
+                    _line_text(data, starts[is_f], ends[is_f], 2), v_before[is_f], vt_before[is_f], vn_before[is_f])
+                corner, face = totals['corners'], totals['f']
+                face_indices[corner:corner + len(faces)] = faces
+                face_texcoords[corner:corner + len(faces)] = corner_texcoords
+                face_normals[corner:corner + len(faces)] = corner_normals
+                face_offsets[face + 1:face + 1 + len(arity)] = corner + np.cumsum(arity)
+                totals['corners'] += len(faces)
+
+            b0 = data[starts]
+            for line in np.flatnonzero(np.isin(b0, (ord('o'), ord('g'), ord('u'), ord('m')))):
+                keyword, _, name = bytes(data[starts[line]:ends[line]]).decode('utf-8', 'replace').strip().partition(' ')
+                name = name.strip()
+                if keyword == 'mtllib':
+                    mtllibs.extend(name.split())
+                elif keyword in state:
+                    state[keyword] = name
+                    group_starts.append((int(f_before[line]), state['o'], state['g'], state['usemtl']))
+
+            totals['v'] = int(v_before[-1]) if len(v_before) else totals['v']
+            totals['vt'] = int(vt_before[-1]) if len(vt_before) else totals['vt']
+            totals['vn'] = int(vn_before[-1]) if len(vn_before) else totals['vn']
+            totals['f'] += int(is_f.sum())
+            if on_block is not None:
+                on_block(min(file.tell() / size, 1.0), parsed())
 
-    with open(filename, 'r') as file:
+    groups = []
+    for i, (face_start, *names) in enumerate(group_starts):
+        face_end = group_starts[i + 1][0] if i + 1 < len(group_starts) else totals['f']
+        if face_end > face_start:
+            groups.append((face_start, face_end, *names))
+    return parsed(groups, mtllibs)
+
+def read_mtl(filename):
+    """Materials of an MTL file as {name: {keyword: value}}.
+
+    Ka, Kd and Ks become float triples and map_* statements keep only their
+    file name, which follows any options; other values stay strings.
+    """
+    materials, current = {}, None
+    with open(filename, encoding='utf-8', errors='replace') as file:
         for line in file:
-            if line.startswith('v '):
-                vertex = parse_vertex(line)
-                vertices.append(vertex)
-            elif line.startswith('f '):
-                face = parse_face(line)
-                faces.append(face)
-
-    vertices = np.array(vertices)
-    centroid = np.mean(vertices, axis=0)
-    vertices -= centroid
-
-    edges = set()
-    for face in faces:
-        for i in range(len(face)):
-            edge = (face[i], face[(i + 1) % len(face)])
-            edges.add(tuple(sorted(edge)))
-
-    edges = list(edges)
-
-    return vertices, faces, edges
+            keyword, _, value = line.strip().partition(' ')
+            value = value.strip()
+            if keyword == 'newmtl':
+                current = materials[value] = {}
+            elif current is None or not keyword or keyword.startswith('#') or not value:
+                continue
+            elif keyword in ('Ka', 'Kd', 'Ks'):
+                current[keyword] = tuple(float(x) for x in value.split()[:3])
+            elif keyword.startswith('map_'):
+                current[keyword] = value.split()[-1]
+            else:
+                current[keyword] = value
+    return materials
+
+def smooth_normals(mesh):
+    """One unit normal per position for smooth shading.
+
+    Averaged from the file's vn records where every corner of the mesh has
+    one, otherwise accumulated from the faces by area (pipeline.vertex_normals).
+    """
+    normals = vertex_normals(mesh.positions, mesh.face_indices, mesh.face_offsets)
+    if len(mesh.normals) and len(mesh.face_normals) and (mesh.face_normals >= 0).all():
+        from_file = np.zeros_like(normals)
+        np.add.at(from_file, mesh.face_indices, mesh.normals[mesh.face_normals])
+        normalize(from_file)
+        # Vertices whose vn records cancel out keep the computed normal
+        normals = np.where(np.abs(from_file).sum(axis=1, keepdims=True) > 0, from_file, normals)
+    return normals.astype(np.float32)
+
+def cache_path(filename):
+    return filename + CACHE_SUFFIX
+
+def _cache_key(filename):
+    stat = os.stat(filename)
+    return os.path.abspath(filename), np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+def load_cache(filename):
+    """Return the cached arrays for an OBJ file, or None if the cache is missing or stale."""
+    path = cache_path(filename)
+    if not os.path.exists(path):
+        return None
+    source, key = _cache_key(filename)
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['version']) != CACHE_VERSION or str(data['source']) != source:
+                return None
+            if not np.array_equal(data['key'], key):
+                return None
+            return {name: data[name] for name in data.files}
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+        print(f"Ignoring unreadable mesh cache {path}: {e}")
+        return None
+
+def save_cache(filename, arrays):
+    """Write arrays next to the OBJ file, replacing any previous cache atomically."""
+    path = cache_path(filename)
+    source, key = _cache_key(filename)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    except OSError as e:
+        print(f"Could not write mesh cache {path}: {e}")
+        return
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            np.savez(file, version=CACHE_VERSION, source=source, key=key, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException as e:
+        # Never leave a half-written temporary file next to the OBJ
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        if not isinstance(e, OSError):
+            raise
+        print(f"Could not write mesh cache {path}: {e}")
+
+def derive_arrays(arrays):
+    """Edges, BVH, vertex normals and LOD levels of a centered mesh, from and to flat cache arrays.
+
+    A plain function of arrays, so it can run in another process.
+    """
+    mesh = Mesh.from_arrays(arrays)
+    derived = {'edges': build_edges(mesh.face_indices, mesh.face_offsets)}
+    derived.update(BVH.build(mesh.positions, mesh.face_indices, mesh.face_offsets).to_arrays())
+    derived['vertex_normals'] = smooth_normals(mesh)
+    derived.update(lods_to_arrays(build_lods(mesh.positions, mesh.face_indices, mesh.face_offsets,
+                                             derived['vertex_normals'])))
+    return derived
+
+
+def load_mesh(filename, use_cache=True, chunk_size=CHUNK_SIZE, on_block=None, executor=None):
+    """Load an OBJ file as a centered Mesh with its edges, BVH, vertex normals and LOD levels.
+
+    The parsed arrays, edges, BVH, vertex normals and LOD levels are stored in a compiled cache
+    next to the OBJ file and reused on later loads until the file's size or modification
+    time changes. chunk_size and on_block are passed to read_obj when the file is parsed.
+    With an executor, e.g. a process pool, the derived arrays are built by derive_arrays there.
+    """
+    arrays = load_cache(filename) if use_cache else None
+    if arrays is None:
+        mesh = read_obj(filename, chunk_size, on_block)
+        if len(mesh.positions):
+            mesh.positions -= mesh.positions.mean(axis=0, dtype=np.float64).astype(np.float32)
+        arrays = mesh.to_arrays()
+        arrays.update(executor.submit(derive_arrays, arrays).result() if executor else derive_arrays(arrays))
+        if use_cache:
+            save_cache(filename, arrays)
+
+    mesh = Mesh.from_arrays(arrays)
+    mesh.edges = arrays['edges']
+    mesh.bvh = BVH.from_arrays(arrays)
+    mesh.vertex_normals = arrays['vertex_normals']
+    mesh.lods = lods_from_arrays(mesh.positions, mesh.face_indices, mesh.face_offsets, mesh.vertex_normals, arrays)
+    return mesh
+
+
+def load_obj(filename):
+    """Load an OBJ file as a Mesh, through the compiled cache."""
+    return load_mesh(filename)
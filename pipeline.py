@@ -0,0 +1,276 @@
+import numpy as np
+from lighting import illuminate
+
+SHADING_MODES = ('flat', 'gouraud', 'phong')
+
+
+def rotate_x(angle):
+    cos_angle, sin_angle = np.cos(angle), np.sin(angle)
+    return np.array([
+        [1, 0, 0],
+        [0, cos_angle, -sin_angle],
+        [0, sin_angle, cos_angle]
+    ])
+
+
+def rotate_y(angle):
+    cos_angle, sin_angle = np.cos(angle), np.sin(angle)
+    return np.array([
+        [cos_angle, 0, sin_angle],
+        [0, 1, 0],
+        [-sin_angle, 0, cos_angle]
+    ])
+
+
+def translate(offset):
+    """4x4 translation for row vectors (points @ matrix)."""
+    matrix = np.eye(4)
+    matrix[3, :3] = offset
+    return matrix
+
+
+def scale_matrix(factor):
+    return np.diag([factor, factor, factor, 1.0])
+
+
+def linear(matrix3):
+    """Embed a 3x3 rotation/scale in a 4x4 matrix."""
+    matrix = np.eye(4)
+    matrix[:3, :3] = matrix3
+    return matrix
+
+
+def perspective(fov, aspect, near, far):
+    """4x4 perspective projection for row vectors, fov being vertical in radians.
+
+    Clip-space w is the view-space depth, and z / w maps [near, far] onto [0, 1].
+    """
+    focal = 1.0 / np.tan(fov / 2)
+    matrix = np.zeros((4, 4))
+    matrix[0, 0] = focal / aspect
+    matrix[1, 1] = focal
+    matrix[2, 2] = far / (far - near)
+    matrix[3, 2] = -far * near / (far - near)
+    matrix[2, 3] = 1.0
+    return matrix
+
+
+def transform(points, matrix):
+    """Apply a 4x4 matrix to an (N, 3) array of points, returning (N, 4) homogeneous coordinates."""
+    return np.asarray(points, dtype=np.float64) @ matrix[:3] + matrix[3]
+
+
+def to_screen(clip, width, height):
+    """Perspective divide and viewport mapping of (N, 4) clip coordinates.
+
+    Returns (N, 2) pixel positions and the (N,) normalized depth. Points at or
+    behind the eye produce garbage and must be clipped or culled beforehand.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ndc = clip[:, :3] / clip[:, 3:]
+    return (ndc[:, :2] + 1) * (width / 2, height / 2), ndc[:, 2]
+
+
+def pack_faces(faces):
+    """Pack a list of polygon index lists into flat index and offset arrays."""
+    counts = np.fromiter((len(face) for face in faces), dtype=np.int32, count=len(faces))
+    offsets = np.zeros(len(faces) + 1, dtype=np.int32)
+    np.cumsum(counts, out=offsets[1:])
+    indices = np.fromiter((v for face in faces for v in face), dtype=np.int32, count=int(offsets[-1]))
+    return indices, offsets
+
+
+def select_faces(face_indices, face_offsets, faces):
+    """Packed index and offset arrays holding only the given faces, in that order."""
+    counts = face_offsets[faces + 1] - face_offsets[faces]
+    offsets = np.zeros(len(faces) + 1, dtype=np.int32)
+    np.cumsum(counts, out=offsets[1:])
+    corners = np.repeat(face_offsets[faces] - offsets[:-1], counts) + np.arange(offsets[-1])
+    return face_indices[corners], offsets
+
+
+def next_corners(face_indices, face_offsets):
+    """Position of the following corner of the same face for every corner."""
+    following = np.arange(1, len(face_indices) + 1)
+    following[face_offsets[1:] - 1] = face_offsets[:-1]
+    return following
+
+
+def build_edges(face_indices, face_offsets):
+    """Unique undirected edges of a packed face array as an (E, 2) int32 array.
+
+    Corners repeating their neighbour, as in simplified LOD levels, add no edge.
+    """
+    a = face_indices.astype(np.int64)
+    b = a[next_corners(face_indices, face_offsets)]
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+    # One int64 key per edge makes the dedupe a plain 1-D sort
+    n = int(hi.max()) + 1 if len(hi) else 1
+    keys = np.unique((lo * n + hi)[lo != hi])
+    return np.stack([keys // n, keys % n], axis=1).astype(np.int32)
+
+
+class CullStats:
+    """Per-frame counters of the faces removed before shading and drawing."""
+
+    def __init__(self):
+        self.total = self.backfacing = self.outside = self.drawn = 0
+
+    @property
+    def skipped(self):
+        return self.total - self.drawn
+
+    def __str__(self):
+        return f"Faces: {self.drawn}/{self.total} ({self.backfacing} back, {self.outside} outside)"
+
+
+def cull_faces(screen_points, depths, face_indices, face_offsets, width, height, near=None, front=-1, stats=None):
+    """Indices of the faces that face the camera and are at least partly in view.
+
+    Orientation comes from the sign of each face's projected area, which is
+    compared with `front` (-1 or 1, depending on the handedness of the screen
+    mapping). Faces whose corners all lie beyond one viewport edge, or all in
+    front of the `near` depth, are dropped too.
+    """
+    starts = face_offsets[:-1]
+    x = screen_points[face_indices, 0].astype(np.float64)
+    y = screen_points[face_indices, 1].astype(np.float64)
+    following = next_corners(face_indices, face_offsets)
+    areas = np.add.reduceat(x * y[following] - x[following] * y, starts)
+    backfacing = areas * front <= 0
+
+    outside = ((np.maximum.reduceat(x, starts) < 0) | (np.minimum.reduceat(x, starts) > width) |
+               (np.maximum.reduceat(y, starts) < 0) | (np.minimum.reduceat(y, starts) > height))
+    if near is not None:
+        outside |= np.maximum.reduceat(depths[face_indices], starts) < near
+    outside &= ~backfacing
+
+    visible = np.flatnonzero(~(backfacing | outside))
+    if stats is not None:
+        stats.total = len(starts)
+        stats.backfacing = int(backfacing.sum())
+        stats.outside = int(outside.sum())
+        stats.drawn = len(visible)
+    return visible
+
+
+def faces_in_depth_range(depths, face_indices, face_offsets, near, far):
+    """Indices of the faces with at least one corner beyond near and one before far."""
+    starts = face_offsets[:-1]
+    corner_depths = depths[face_indices]
+    return np.flatnonzero((np.maximum.reduceat(corner_depths, starts) >= near) &
+                          (np.minimum.reduceat(corner_depths, starts) <= far))
+
+
+def clip_near(clip, face_indices, face_offsets, near):
+    """Clip packed polygons against the plane w = near in homogeneous space.
+
+    Every face must have at least one corner with w >= near (see
+    faces_in_depth_range). New corners are appended to the returned clip array,
+    and faces keep their order, so per-face attributes still line up.
+    """
+    w = clip[face_indices, 3]
+    inside = w >= near
+    following = next_corners(face_indices, face_offsets)
+    crossing = inside != inside[following]
+    if not crossing.any():
+        return clip, face_indices, face_offsets
+
+    # Sutherland-Hodgman, one plane: keep inside corners, add a corner where an edge crosses
+    crossed = np.flatnonzero(crossing)
+    a, b = face_indices[crossed], face_indices[following[crossed]]
+    t = (near - clip[a, 3]) / (clip[b, 3] - clip[a, 3])
+    clip = np.concatenate([clip, clip[a] + (clip[b] - clip[a]) * t[:, None]])
+    new_corners = np.full(len(face_indices), -1, dtype=np.int32)
+    new_corners[crossed] = len(clip) - len(crossed) + np.arange(len(crossed))
+
+    emitted = inside.astype(np.int32) + crossing
+    counts = np.add.reduceat(emitted, face_offsets[:-1])
+    offsets = np.zeros(len(counts) + 1, dtype=np.int32)
+    np.cumsum(counts, out=offsets[1:])
+    corner = np.repeat(np.arange(len(face_indices)), emitted)
+    slot = np.arange(int(offsets[-1])) - np.repeat(np.cumsum(emitted) - emitted, emitted)
+    indices = np.where((slot == 0) & inside[corner], face_indices[corner], new_corners[corner]).astype(np.int32)
+    return clip, indices, offsets
+
+
+def normalize(vectors):
+    """Scale the rows of an (N, 3) float array to unit length in place, leaving zero rows alone."""
+    lengths = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, lengths, out=vectors, where=lengths > 0)
+    return vectors
+
+
+def face_normals(vertices, face_indices, face_offsets):
+    """Unit Newell normal of every face, summed over all its corners.
+
+    Unlike a cross product of the first three corners, it stays right when
+    some corners coincide, as they do in a level of detail morphing into the next.
+    """
+    corners = vertices[face_indices]
+    return normalize(np.add.reduceat(np.cross(corners, corners[next_corners(face_indices, face_offsets)]),
+                                     face_offsets[:-1], axis=0))
+
+
+def vertex_normals(vertices, face_indices, face_offsets):
+    """Area-weighted unit normal of every vertex, accumulated from the faces around it.
+
+    Each face adds its Newell normal, whose length is twice the face's area, so
+    large faces count for more than the slivers next to them.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    corners = vertices[face_indices]
+    areas = np.add.reduceat(np.cross(corners, corners[next_corners(face_indices, face_offsets)]),
+                            face_offsets[:-1], axis=0)
+    normals = np.zeros_like(vertices)
+    np.add.at(normals, face_indices, np.repeat(areas, np.diff(face_offsets), axis=0))
+    return normalize(normals)
+
+
+def face_centers(vertices, face_indices, face_offsets):
+    """Mean position of the corners of every face."""
+    counts = np.diff(face_offsets)
+    sums = np.add.reduceat(vertices[face_indices], face_offsets[:-1], axis=0)
+    return sums / counts[:, None]
+
+
+def lambert(normals, centers, light_pos, ambient_light, diffuse_light):
+    """Ambient plus Lambert diffuse intensity of every face for a point light."""
+    light_dirs = light_pos - centers
+    light_dirs /= np.linalg.norm(light_dirs, axis=1, keepdims=True)
+    dots = np.einsum('ij,ij->i', normals, light_dirs)
+    return ambient_light + np.maximum(dots, 0) * diffuse_light
+
+
+def painter_order(depths):
+    """Face indices sorted back to front (largest depth first)."""
+    return np.argsort(-depths, kind='stable')
+
+
+def shade_faces(vertices, face_indices, face_offsets, lights, ambient_light, sort=True, depths=None,
+                shadowed=None):
+    """Run the whole per-face stage on a mesh in a handful of array operations.
+
+    Returns the face normals, centers, lighting intensities from every light
+    in `lights`, depths and the painter's-order permutation (None when sort is
+    False, e.g. for z-buffering). Depths default to the z of the face centers;
+    pass per-face view depths when vertices are not in view space. shadowed
+    is an optional (L, F) mask of faces hidden from each light.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    normals = face_normals(vertices, face_indices, face_offsets)
+    centers = face_centers(vertices, face_indices, face_offsets)
+    intensities, _ = illuminate(lights, normals, centers, ambient_light, shadowed=shadowed)
+    if depths is None:
+        depths = centers[:, 2]
+    return normals, centers, intensities, depths, painter_order(depths) if sort else None
+
+
+def shaded_colors(base_colors, intensities=None, specular=None):
+    """Scale base colors by lighting intensities, add white specular highlights and clamp to bytes."""
+    colors = np.array(base_colors, dtype=np.float64)
+    if intensities is not None:
+        colors *= intensities[..., None]
+    if specular is not None:
+        colors += specular[..., None] * 255
+    return np.clip(colors, 0, 255).astype(np.int32)
@@ -0,0 +1,39 @@
+import numpy as np
+from mesh import Mesh
+
+def cube():
+    """Cube spanning [-1, 1] as a Mesh with outward-wound faces, edges, texture coordinates and white faces."""
+    vertices = np.array([
+        [-1, -1, -1],
+        [1, -1, -1],
+        [1, 1, -1],
+        [-1, 1, -1],
+        [-1, -1, 1],
+        [1, -1, 1],
+        [1, 1, 1],
+        [-1, 1, 1]
+    ])
+    edges = [
+        (0, 1), (1, 2), (2, 3), (3, 0),
+        (4, 5), (5, 6), (6, 7), (7, 4),
+        (0, 4), (1, 5), (2, 6), (3, 7)
+    ]
+    faces = [
+        [0, 3, 2, 1],  # Front face
+        [4, 5, 6, 7],  # Back face
+        [0, 1, 5, 4],  # Bottom face
+        [2, 3, 7, 6],  # Top face
+        [1, 2, 6, 5],  # Right face
+        [0, 4, 7, 3]   # Left face
+    ]
+    texcoords = [
+        [(0, 0), (0, 1), (1, 1), (1, 0)],  # Front face
+        [(0, 0), (1, 0), (1, 1), (0, 1)],  # Back face
+        [(0, 0), (1, 0), (1, 1), (0, 1)],  # Bottom face
+        [(0, 0), (1, 0), (1, 1), (0, 1)],  # Top face
+        [(0, 0), (1, 0), (1, 1), (0, 1)],  # Right face
+        [(0, 0), (0, 1), (1, 1), (1, 0)]   # Left face
+    ]
+    mesh = Mesh.from_faces(vertices, faces, np.full((len(faces), 3), 255), texcoords)
+    mesh.edges = np.array(edges, dtype=np.int32)
+    return mesh
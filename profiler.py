@@ -0,0 +1,113 @@
+import csv
+import json
+import time
+import pygame as pg
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+
+
+class _Scope:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler, self.name = profiler, name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullScope:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SCOPE = _NullScope()
+
+
+class Profiler:
+    """Times named pipeline scopes and keeps the last `history` samples of each.
+
+    While disabled, scope() hands back one shared no-op context manager, so
+    instrumented code costs a method call and nothing else.
+    """
+
+    def __init__(self, enabled=False, history=240):
+        self.enabled = enabled
+        self.history = history
+        self._samples = {}  # name -> [ring buffer, samples written]
+
+    def scope(self, name):
+        return _Scope(self, name) if self.enabled else _NULL_SCOPE
+
+    def record(self, name, seconds):
+        entry = self._samples.get(name)
+        if entry is None:
+            entry = self._samples[name] = [np.zeros(self.history), 0]
+        entry[0][entry[1] % self.history] = seconds
+        entry[1] += 1
+
+    def reset(self):
+        self._samples.clear()
+
+    @property
+    def names(self):
+        return list(self._samples)
+
+    def samples(self, name):
+        """Recorded samples of a scope in seconds, oldest first."""
+        buffer, count = self._samples[name]
+        if count <= self.history:
+            return buffer[:count].copy()
+        return np.roll(buffer, -(count % self.history))
+
+    def histogram(self, name, bins=16):
+        """Counts and millisecond bin edges of a scope's recent samples."""
+        return np.histogram(self.samples(name) * 1000.0, bins=bins)
+
+    def summary(self):
+        """Per-scope mean, max and percentiles in milliseconds."""
+        result = {}
+        for name in list(self._samples):  # Scopes may be added by a render thread meanwhile
+            samples = self.samples(name) * 1000.0
+            stats = {f"p{p}": float(np.percentile(samples, p)) for p in PERCENTILES}
+            stats.update(mean=float(samples.mean()), max=float(samples.max()), count=self._samples[name][1])
+            result[name] = stats
+        return result
+
+    def dump_json(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def dump_csv(self, path):
+        summary = self.summary()
+        columns = ['mean', 'max', 'count'] + [f"p{p}" for p in PERCENTILES]
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['scope'] + [f"{c}_ms" if c != 'count' else c for c in columns])
+            for name, stats in summary.items():
+                writer.writerow([name] + [stats[c] for c in columns])
+
+    def draw_overlay(self, surface, font, pos=(2, 60), bins=16):
+        """Draw one row per scope with mean/p90 and a bar histogram of recent samples."""
+        x, y = pos
+        for name, stats in self.summary().items():
+            text = font.render(f"{name}: {stats['mean']:.2f} / {stats['p90']:.2f} ms", True, (255, 255, 255))
+            surface.blit(text, (x, y))
+            counts, _ = self.histogram(name, bins)
+            peak = max(int(counts.max()), 1)
+            graph_x = x + 300
+            for i, count in enumerate(counts.tolist()):
+                bar = int(16 * count / peak)
+                pg.draw.rect(surface, (80, 200, 80), (graph_x + i * 5, y + 18 - bar, 4, bar))
+            y += text.get_height() + 2
@@ -0,0 +1,235 @@
+import pygame as pg
+import numpy as np
+
+MAX_FRAGMENTS = 1 << 20  # Candidate pixels tested per batch, bounds temporary memory
+
+_RGB = np.dtype((np.void, 3))
+
+
+class FrameBuffer:
+    """Color and depth buffers laid out as (x, y) like pygame.surfarray."""
+
+    BYTES_PER_PIXEL = 7  # uint8 RGB plus float32 depth
+
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self.color = np.zeros((width, height, 3), dtype=np.uint8)
+        self.depth = np.full((width, height), np.inf, dtype=np.float32)
+        self._surface = None
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def clear(self, color=(0, 0, 0)):
+        if color[0] == color[1] == color[2]:
+            self.color.fill(color[0])
+        else:
+            self.color[...] = color
+        self.depth.fill(np.inf)
+
+    def to_surface(self):
+        """Copy the color buffer into a pygame Surface that is reused between frames."""
+        if self._surface is None:
+            self._surface = pg.Surface(self.size)
+        pg.surfarray.blit_array(self._surface, self.color)
+        return self._surface
+
+
+def triangulate(face_indices, face_offsets):
+    """Fan-triangulate packed polygons.
+
+    Returns a (T, 3) array of positions in the flat corner array, so both vertex
+    indices and per-corner attributes can be gathered from it, and the face each
+    triangle came from.
+    """
+    counts = np.maximum(np.diff(face_offsets) - 2, 0)
+    tri_faces = np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+    first_tris = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    steps = np.arange(len(tri_faces)) - first_tris[tri_faces] + 1
+    starts = face_offsets[:-1][tri_faces]
+    tri_corners = np.stack([starts, starts + steps, starts + steps + 1], axis=1).astype(np.int32)
+    return tri_corners, tri_faces
+
+
+def _edge(ax, ay, bx, by, px, py):
+    return (bx - ax) * (py - ay) - (by - ay) * (px - ax)
+
+
+def _fragments(xy, width, height, max_fragments):
+    """Yield the pixels covered by screen-space triangles, a batch at a time.
+
+    Each triangle is walked as one exact span per pixel row, so the work is
+    proportional to the covered pixels rather than to bounding-box area. Each
+    batch is (triangle ids, pixel x, pixel y, barycentric weights).
+    """
+    x, y = xy[..., 0], xy[..., 1]
+    x0 = np.maximum(np.ceil(x.min(axis=1) - 0.5), 0).astype(np.int64)
+    x1 = np.minimum(np.floor(x.max(axis=1) - 0.5), width - 1).astype(np.int64)
+    y0 = np.maximum(np.ceil(y.min(axis=1) - 0.5), 0).astype(np.int64)
+    y1 = np.minimum(np.floor(y.max(axis=1) - 0.5), height - 1).astype(np.int64)
+    signed_area = _edge(x[:, 0], y[:, 0], x[:, 1], y[:, 1], x[:, 2], y[:, 2])
+
+    # Barycentric weights as planes w = a * px + b * py + c, one per corner
+    tris = np.flatnonzero((x1 >= x0) & (y1 >= y0) & (signed_area != 0))
+    xa, ya = x[tris], y[tris]
+    xb, yb = np.roll(xa, -1, axis=1), np.roll(ya, -1, axis=1)
+    xc, yc = np.roll(xa, -2, axis=1), np.roll(ya, -2, axis=1)
+    inv_area = 1.0 / signed_area[tris, None]
+    plane_a = -(yc - yb) * inv_area
+    plane_b = (xc - xb) * inv_area
+    plane_c = ((yc - yb) * xb - (xc - xb) * yb) * inv_area
+
+    # One span per covered row: intersect the three half-planes w >= 0
+    row_counts = y1[tris] - y0[tris] + 1
+    row_tris = np.repeat(np.arange(len(tris)), row_counts)
+    row_y = y0[tris][row_tris] + np.arange(int(row_counts.sum())) - np.repeat(np.cumsum(row_counts) - row_counts, row_counts)
+    a = plane_a[row_tris]
+    center_y = (row_y + 0.5)[:, None]
+    limit = -(plane_b[row_tris] * center_y + plane_c[row_tris])
+    # Where each edge line crosses the row, from its endpoints in a canonical order so
+    # that triangles sharing an edge get bit-identical bounds and leave no cracks
+    swap = (yb > yc) | ((yb == yc) & (xb > xc))
+    px0, py0 = np.where(swap, xc, xb)[row_tris], np.where(swap, yc, yb)[row_tris]
+    px1, py1 = np.where(swap, xb, xc)[row_tris], np.where(swap, yb, yc)[row_tris]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bound = px0 + (center_y - py0) * (px1 - px0) / (py1 - py0)
+    lo = np.where(a > 0, bound, -np.inf).max(axis=1)
+    hi = np.where(a < 0, bound, np.inf).min(axis=1)
+    # Pixel centers in [lo, hi) are covered, so a shared edge belongs to exactly one triangle
+    row_x0 = np.maximum(np.ceil(lo - 0.5), x0[tris][row_tris])
+    row_x1 = np.minimum(np.ceil(hi - 0.5) - 1, x1[tris][row_tris])
+    spans = np.maximum(row_x1 - row_x0 + 1, 0).astype(np.int64)
+    spans[((a == 0) & (limit > 0)).any(axis=1)] = 0
+    row_x0 = np.where(spans > 0, row_x0, 0).astype(np.int64)
+
+    plane_a32, plane_b32, plane_c32 = (plane.astype(np.float32) for plane in (plane_a, plane_b, plane_c))
+    ends = np.cumsum(spans)
+    batch_start = 0
+    while batch_start < len(spans):
+        base = ends[batch_start - 1] if batch_start else 0
+        batch_end = max(int(np.searchsorted(ends, base + max_fragments, side='right')), batch_start + 1)
+        counts = spans[batch_start:batch_end]
+        rows = np.repeat(np.arange(batch_start, batch_end), counts)
+        local_ids = row_tris[rows]
+        px = row_x0[rows] + np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        py = row_y[rows]
+        centers_x = (px + 0.5).astype(np.float32)[:, None]
+        centers_y = (py + 0.5).astype(np.float32)[:, None]
+        weights = plane_a32[local_ids] * centers_x + plane_b32[local_ids] * centers_y + plane_c32[local_ids]
+        yield tris[local_ids], px, py, weights
+        batch_start = batch_end
+
+
+def rasterize(frame, xy, z, shade, max_fragments=MAX_FRAGMENTS):
+    """Depth-tested rasterization of screen-space triangles into a FrameBuffer.
+
+    xy is (T, 3, 2) pixel coordinates and z is (T, 3) depth, smaller being nearer.
+    shade(tri_ids, weights) returns (n, 3) colors and is only called for the
+    fragments that end up visible.
+    """
+    z0, z1, z2 = np.asarray(z, dtype=np.float32).T.copy()
+    depth_buffer = frame.depth.reshape(-1)
+    # View each RGB triple as a single 3-byte item so scattering colors is one copy per pixel
+    color_buffer = frame.color.reshape(-1, 3).view(_RGB).reshape(-1)
+    for ids, px, py, weights in _fragments(xy, frame.width, frame.height, max_fragments):
+        pixels = px * frame.height + py
+        depth = weights[:, 0] * z0[ids] + weights[:, 1] * z1[ids] + weights[:, 2] * z2[ids]
+        np.minimum.at(depth_buffer, pixels, depth)
+        visible = depth <= depth_buffer[pixels]
+        if visible.any():
+            colors = np.ascontiguousarray(shade(ids[visible], weights[visible]), dtype=np.uint8)
+            color_buffer[pixels[visible]] = colors.view(_RGB).reshape(-1)
+
+
+def interpolate(weights, values, inv_w=None):
+    """Blend per-corner values (n, 3, k) of each fragment's triangle with its barycentric weights.
+
+    With inv_w, the (n, 3) reciprocal clip-space w of the corners, the blend
+    is perspective-correct instead of affine in screen space.
+    """
+    if inv_w is not None:
+        weights = weights * inv_w
+        weights /= weights.sum(axis=1, keepdims=True)
+    return np.einsum('ij,ijk->ik', weights, values)
+
+
+def draw_triangles(frame, xy, z, colors):
+    """Rasterize flat-colored triangles; colors is (T, 3)."""
+    colors = np.asarray(colors, dtype=np.uint8)
+    rasterize(frame, xy, z, lambda ids, weights: np.take(colors, ids, axis=0))
+
+
+def clip_segments(segments, width, height):
+    """Clip (E, 2, 2) segments to the viewport, dropping the ones fully outside."""
+    segments = np.asarray(segments, dtype=np.float64)
+    start, delta = segments[:, 0], segments[:, 1] - segments[:, 0]
+    t0, t1 = np.zeros(len(segments)), np.ones(len(segments))
+    # Liang-Barsky: each viewport edge bounds the segment parameter from one side
+    for axis, limit in ((0, width - 1), (1, height - 1)):
+        d, p = delta[:, axis], start[:, axis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            low, high = -p / d, (limit - p) / d
+        enter = np.where(d > 0, low, np.where(d < 0, high, -np.inf))
+        leave = np.where(d > 0, high, np.where(d < 0, low, np.inf))
+        outside = (d == 0) & ((p < 0) | (p > limit))
+        t0 = np.maximum(t0, enter)
+        t1 = np.where(outside, -1.0, np.minimum(t1, leave))
+    keep = t0 <= t1
+    start, delta = start[keep], delta[keep]
+    return np.stack([start + delta * t0[keep, None], start + delta * t1[keep, None]], axis=1)
+
+
+def draw_lines(frame, segments, color, max_fragments=MAX_FRAGMENTS):
+    """Draw (E, 2, 2) screen-space line segments with a vectorized DDA, ignoring depth."""
+    segments = clip_segments(segments, frame.width, frame.height)
+    start, delta = segments[:, 0], segments[:, 1] - segments[:, 0]
+    steps = np.ceil(np.abs(delta).max(axis=1)).astype(np.int64)
+    counts = steps + 1
+    step_size = delta / np.maximum(steps, 1)[:, None]
+    color = np.asarray(color, dtype=np.uint8).view(_RGB)[0]
+    color_buffer = frame.color.reshape(-1, 3).view(_RGB).reshape(-1)
+    ends = np.cumsum(counts)
+    batch_start = 0
+    while batch_start < len(counts):
+        base = ends[batch_start - 1] if batch_start else 0
+        batch_end = max(int(np.searchsorted(ends, base + max_fragments, side='right')), batch_start + 1)
+        batch = counts[batch_start:batch_end]
+        ids = np.repeat(np.arange(batch_start, batch_end), batch)
+        t = np.arange(int(batch.sum())) - np.repeat(np.cumsum(batch) - batch, batch)
+        points = np.rint(start[ids] + step_size[ids] * t[:, None]).astype(np.int64)
+        color_buffer[points[:, 0] * frame.height + points[:, 1]] = color
+        batch_start = batch_end
+
+
+def draw_points(frame, points, color, radius=1):
+    """Stamp a filled disc of the given pixel radius at each (N, 2) screen point."""
+    offsets = np.mgrid[-radius:radius + 1, -radius:radius + 1].reshape(2, -1).T
+    offsets = offsets[(offsets ** 2).sum(axis=1) <= radius * radius]
+    pixels = (np.rint(points).astype(np.int64)[:, None, :] + offsets).reshape(-1, 2)
+    pixels = pixels[(pixels[:, 0] >= 0) & (pixels[:, 0] < frame.width) &
+                    (pixels[:, 1] >= 0) & (pixels[:, 1] < frame.height)]
+    color_buffer = frame.color.reshape(-1, 3).view(_RGB).reshape(-1)
+    color_buffer[pixels[:, 0] * frame.height + pixels[:, 1]] = np.asarray(color, dtype=np.uint8).view(_RGB)[0]
+
+
+def draw_textured_triangles(frame, xy, z, uv, texture, intensities=None, inv_w=None):
+    """Rasterize textured triangles, sampling the nearest texel per pixel.
+
+    uv is (T, 3, 2) texture coordinates that wrap outside [0, 1] and texture is
+    a (width, height, 3) surfarray. Coordinates are interpolated affinely unless
+    inv_w, the (T, 3) reciprocal clip-space w of each corner, is given for
+    perspective-correct interpolation. intensities optionally scales each triangle.
+    """
+    texture_width, texture_height = texture.shape[:2]
+
+    def shade(ids, weights):
+        u, v = interpolate(weights, uv[ids], None if inv_w is None else inv_w[ids]).T
+        tx = (u * texture_width).astype(np.int64) % texture_width
+        ty = (v * texture_height).astype(np.int64) % texture_height
+        texels = texture[tx, ty]
+        if intensities is None:
+            return texels
+        return np.clip(texels * intensities[ids, None], 0, 255).astype(np.uint8)
+
+    rasterize(frame, xy, z, shade)
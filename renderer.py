@@ -0,0 +1,276 @@
+import pygame as pg
+import numpy as np
+from pipeline import (transform, to_screen, faces_in_depth_range, clip_near, select_faces, cull_faces,
+                      shade_faces, painter_order, shaded_colors, CullStats, SHADING_MODES)
+from profiler import Profiler
+from rasterizer import FrameBuffer, triangulate, rasterize, interpolate, draw_triangles
+from ssaa import Supersampler
+from tiles import TiledRasterizer, draw_triangles_tiled
+from bvh import face_shadows
+from lod import LODSelector
+from lighting import illuminate, point_light
+
+
+class Renderer:
+    """Transforms, culls, shades and draws a mesh into an offscreen surface.
+
+    Nothing here touches the display, so the interactive viewer and headless
+    tools such as benchmark.py run exactly the same pipeline. Every stage runs
+    inside a scope of `profiler`. With `workers` set, the z-buffer path splits
+    the frame into tiles rasterized on that many threads while tiles_enabled.
+
+    `shading` is one of SHADING_MODES. The smooth modes need the mesh's
+    vertex_normals: 'gouraud' lights the vertices and blends the colors,
+    'phong' blends the normals and lights every pixel. Both need the z-buffer
+    to vary across a face; the painter's algorithm averages the vertex lighting.
+
+    With render_scale set, frames are drawn at that fraction of width x height,
+    below 1 or up to the SSAA multiple, and resampled to the native size.
+    """
+
+    def __init__(self, width, height, ssaa_scale=2, profiler=None, ssaa_mode='smooth', workers=None):
+        self.width, self.height = width, height
+        self.tiler = TiledRasterizer(workers) if workers else None
+        self.tiles_enabled = self.tiler is not None  # Rasterize z-buffer frames on the tile workers
+        self.ssaa = Supersampler(width, height, ssaa_scale, ssaa_mode)
+        self.ssaa_enabled = False
+        self.ssaa_scale = ssaa_scale
+        self.render_scale = None  # Internal resolution scale from a ResolutionController, overrides SSAA
+        self.lighting_enabled = True
+        self.culling_enabled = True
+        self.zbuffer_enabled = False
+        self.shadows_enabled = False  # Needs a mesh with a BVH
+        self.lod_enabled = False  # Draw meshes with lods at the level their size on screen calls for
+        self.lights = [point_light((5, 5, 5), 0.8)]
+        self.ambient_light = 0.2
+        self.specular_light = 0.5  # Smooth shading only
+        self.shininess = 32
+        self.shading = SHADING_MODES[0]
+        self.background = (0, 0, 0)
+        self.cull_stats = CullStats()
+        self.profiler = profiler if profiler is not None else Profiler()
+        # Results of the last frame, in model space, for overlays such as rays
+        self.visible = self.normals = self.centers = self.order = None
+        self._frame = None
+        self.matrix = None  # Model-view-projection of the last rendered frame
+        # Change tracking: geometry is reused while the camera and mesh are unchanged,
+        # and the whole frame while every input is unchanged
+        self.version = 0
+        self.frame_changed = True
+        self._geometry_key = self._geometry = None
+        self._frame_key = self._surface = None
+        self._shadow_key = self._shadows = None
+        self._selector = None  # lod.LODSelector of the last mesh drawn with lod_enabled
+
+    def close(self):
+        """Stop the tile worker threads, if any."""
+        if self.tiler is not None:
+            self.tiler.close()
+
+    def invalidate(self):
+        """Force a full re-render, e.g. after a mesh's arrays were modified in place."""
+        self.version += 1
+
+    def render(self, mesh, camera, face_colors=None):
+        """Render one frame of a mesh.Mesh as seen by camera and return a width x height Surface.
+
+        face_colors defaults to mesh.colors, or white when the mesh has none.
+        With shadows enabled, shadow rays are cast through mesh.bvh, and smooth
+        shading uses mesh.vertex_normals; either is skipped when missing. With
+        lod_enabled, a mesh with lods is drawn at the level picked for its size
+        on screen (lod.LODSelector), and its shadows only at full detail. When
+        nothing that affects the image changed since the last call, the
+        previous Surface is returned as is and frame_changed is False.
+        """
+        if face_colors is None:
+            face_colors = mesh.colors if mesh.colors is not None else np.full((mesh.face_count, 3), 255, np.uint8)
+        if self.lod_enabled and mesh.lods is not None:
+            if self._selector is None or self._selector.mesh is not mesh:
+                self._selector = LODSelector(mesh)
+            level, source_faces = self._selector.select(camera, self.height)
+            if level is not mesh:
+                mesh, face_colors = level, np.asarray(face_colors)[source_faces]
+        vertices, face_indices, face_offsets = mesh.positions, mesh.face_indices, mesh.face_offsets
+        bvh, normals = mesh.bvh, mesh.vertex_normals
+        smooth = self.shading != 'flat' and normals is not None
+        if self.render_scale is not None:
+            self.ssaa.scale = self.render_scale
+        else:
+            self.ssaa.scale = self.ssaa_scale if self.ssaa_enabled else 1
+        ssaa = self.ssaa if self.ssaa_enabled or self.ssaa.scale != 1 else None
+        if ssaa is None:
+            width, height = self.width, self.height
+        elif self.zbuffer_enabled:
+            width, height = ssaa.size(FrameBuffer.BYTES_PER_PIXEL)
+        else:
+            width, height = ssaa.size()
+
+        geometry_key = (camera.state(), self.version, id(vertices), id(face_indices), id(face_offsets),
+                        width, height, self.culling_enabled, id(normals) if smooth else None)
+        frame_key = (geometry_key, np.asarray(face_colors).tobytes(), self.light_state(),
+                     self.ambient_light, self.lighting_enabled, self.zbuffer_enabled,
+                     self.shading, self.specular_light, self.shininess,
+                     ssaa.mode if ssaa is not None else None, self.background,
+                     self.shadows_enabled and bvh is not None, self.tiles_enabled and self.tiler is not None)
+        self.frame_changed = frame_key != self._frame_key
+        if not self.frame_changed:
+            return self._surface
+
+        if geometry_key != self._geometry_key:
+            self._geometry = self._transform_and_cull(vertices, face_indices, face_offsets, camera, width, height,
+                                                      normals if smooth else None)
+            self._geometry_key = geometry_key
+        shadows = None
+        if self.shadows_enabled and bvh is not None and self.lighting_enabled:
+            shadows = self._face_shadows(vertices, face_indices, face_offsets, bvh)
+        surface = self._shade_and_draw(vertices, face_colors, width, height, ssaa, shadows, *self._geometry)
+        self._frame_key, self._surface = frame_key, surface
+        return surface
+
+    def light_state(self):
+        return tuple(light.state() for light in self.lights)
+
+    def _face_shadows(self, vertices, face_indices, face_offsets, bvh):
+        """Per-light, per-face shadow flags, recast only when the geometry or a light moves."""
+        key = (id(bvh), self.version, id(face_offsets), self.light_state())
+        if key != self._shadow_key:
+            with self.profiler.scope('shadows'):
+                self._shadows = face_shadows(bvh, vertices, face_indices, face_offsets, self.lights)
+            self._shadow_key = key
+        return self._shadows
+
+    def _transform_and_cull(self, vertices, face_indices, face_offsets, camera, width, height, normals=None):
+        profiler = self.profiler
+        with profiler.scope('transform'):
+            aspect = self.width / self.height
+            self.matrix = camera.matrix(aspect)
+            clip = transform(vertices, self.matrix)
+            if normals is not None:
+                # Carry model-space positions and normals along, so near-plane clipping interpolates them too
+                clip = np.hstack([clip, vertices, normals])
+
+        with profiler.scope('cull'):
+            # Drop faces entirely outside [near, far], then clip the rest against the near plane
+            in_range = faces_in_depth_range(clip[:, 3], face_indices, face_offsets, camera.near, camera.far)
+            range_indices, range_offsets = select_faces(face_indices, face_offsets, in_range)
+            clip, clipped_indices, clipped_offsets = clip_near(clip, range_indices, range_offsets, camera.near)
+            smooth = None
+            if normals is not None:
+                # Lighting runs in model space, so the eye moves there instead of the normals to view space
+                eye = camera.get_position() / camera.scale_factor
+                smooth = (clip[:, 4:7], clip[:, 7:10], 1.0 / clip[:, 3], eye)
+                clip = clip[:, :4]
+            screen_points, depths = to_screen(clip, width, height)
+            if self.culling_enabled:
+                kept = cull_faces(screen_points, depths, clipped_indices, clipped_offsets, width, height,
+                                  stats=self.cull_stats)
+                self.cull_stats.total = len(face_offsets) - 1
+                self.cull_stats.outside += len(face_offsets) - 1 - len(in_range)
+            else:
+                kept = np.arange(len(in_range))
+            visible = in_range[kept]
+            visible_indices, visible_offsets = select_faces(clipped_indices, clipped_offsets, kept)
+            model_indices, model_offsets = select_faces(face_indices, face_offsets, visible)
+            view_depths = np.add.reduceat(clip[visible_indices, 3], visible_offsets[:-1]) / np.diff(visible_offsets)
+        return (visible, visible_indices, visible_offsets, model_indices, model_offsets, screen_points, depths,
+                view_depths, smooth)
+
+    def _shade_and_draw(self, vertices, face_colors, width, height, ssaa, shadows, visible, visible_indices,
+                        visible_offsets, model_indices, model_offsets, screen_points, depths, view_depths,
+                        smooth):
+        profiler = self.profiler
+        with profiler.scope('shade'):
+            # Lighting is evaluated in model space, so zooming scales the light along with the mesh;
+            # painter's order uses the clip-space w (view depth)
+            shadowed = shadows[:, visible] if shadows is not None else None
+            normals, centers, intensities, _, _ = shade_faces(
+                vertices, model_indices, model_offsets, self.lights, self.ambient_light, sort=False,
+                depths=view_depths, shadowed=shadowed)
+            base_colors = np.asarray(face_colors)[visible]
+            if not self.lighting_enabled:
+                smooth = None
+            specular = None
+            if smooth is not None and not self.zbuffer_enabled:
+                # Polygons are filled with one color, so use the mean of the corners' lighting
+                corner_faces = np.repeat(np.arange(len(visible)), np.diff(visible_offsets))
+                corner_intensities, corner_specular = self._illuminate(
+                    smooth, visible_indices, shadowed[:, corner_faces] if shadowed is not None else None)
+                starts, counts = visible_offsets[:-1], np.diff(visible_offsets)
+                intensities = np.add.reduceat(corner_intensities, starts) / counts
+                specular = np.add.reduceat(corner_specular, starts) / counts
+                smooth = None
+            order = None if self.zbuffer_enabled else painter_order(view_depths)
+            colors = shaded_colors(base_colors, intensities if self.lighting_enabled else None, specular)
+
+        with profiler.scope('draw'):
+            if self.zbuffer_enabled:
+                if self._frame is None or self._frame.size != (width, height):
+                    self._frame = FrameBuffer(width, height)
+                self._frame.clear(self.background)
+                tri_corners, tri_faces = triangulate(visible_indices, visible_offsets)
+                corners = visible_indices[tri_corners]
+                tiler = self.tiler if self.tiles_enabled else None
+                if smooth is not None:
+                    raster = tiler.rasterize if tiler is not None else rasterize
+                    raster(self._frame, screen_points[corners], depths[corners],
+                           self._smooth_shader(smooth, corners, base_colors[tri_faces],
+                                               shadowed[:, tri_faces] if shadowed is not None else None))
+                elif tiler is not None:
+                    draw_triangles_tiled(tiler, self._frame, screen_points[corners], depths[corners],
+                                         colors[tri_faces])
+                else:
+                    draw_triangles(self._frame, screen_points[corners], depths[corners], colors[tri_faces])
+            else:
+                surface = self.ssaa.target() if ssaa is not None else self.ssaa.output()
+                surface.fill(self.background)
+                colors = colors.tolist()
+                points = screen_points[visible_indices].tolist()
+                bounds = visible_offsets.tolist()
+                edge_aa = ssaa is not None and ssaa.mode == 'edge'
+                for k in order.tolist():
+                    polygon = points[bounds[k]:bounds[k + 1]]
+                    pg.draw.polygon(surface, colors[k], polygon)
+                    if edge_aa:
+                        pg.draw.aalines(surface, colors[k], True, polygon)
+
+        with profiler.scope('resolve'):
+            if self.zbuffer_enabled:
+                surface = ssaa.resolve_array(self._frame.color) if ssaa is not None else self._frame.to_surface()
+            elif ssaa is not None:
+                surface = ssaa.resolve(surface)
+
+        self.visible, self.normals, self.centers, self.order = visible, normals, centers, order
+        return surface
+
+    def _illuminate(self, smooth, points, shadowed=None, weights=None):
+        """Smooth-shading light at clipped vertices, or blended across triangle corners with weights."""
+        positions, normals, inv_w, eye = smooth
+        if weights is None:
+            positions, normals = positions[points], normals[points]
+        else:
+            w = inv_w[points]
+            positions, normals = interpolate(weights, positions[points], w), interpolate(weights, normals[points], w)
+        return illuminate(self.lights, normals, positions, self.ambient_light, eye, self.specular_light,
+                          self.shininess, shadowed)
+
+    def _smooth_shader(self, smooth, corners, base_colors, shadowed):
+        """Fragment shader for rasterize() interpolating Gouraud colors or Phong normals across triangles.
+
+        shadowed is the (L, T) mask of triangles hidden from each light.
+        """
+        corner_inv_w = smooth[2][corners]
+        if self.shading == 'gouraud':
+            corner_shadowed = np.repeat(shadowed, 3, axis=1) if shadowed is not None else None
+            intensities, specular = self._illuminate(smooth, corners.ravel(), corner_shadowed)
+            corner_colors = (base_colors[:, None, :] * intensities.reshape(corners.shape)[..., None] +
+                             specular.reshape(corners.shape)[..., None] * 255)
+
+            def shade(ids, weights):
+                colors = interpolate(weights, corner_colors[ids], corner_inv_w[ids])
+                return np.clip(colors, 0, 255).astype(np.uint8)
+        else:
+            def shade(ids, weights):
+                intensities, specular = self._illuminate(smooth, corners[ids], shadowed[:, ids]
+                                                         if shadowed is not None else None, weights)
+                return shaded_colors(base_colors[ids], intensities, specular).astype(np.uint8)
+        return shade
@@ -0,0 +1,56 @@
+import numpy as np
+
+TARGET_FPS = 60
+MIN_SCALE = 0.5  # Lowest internal resolution, as a fraction of the screen
+SCALE_STEP = 0.125  # Scales are rounded to this, so small timing jitter never changes the target size
+WINDOW = 10  # Rendered frames measured before each decision
+
+
+class ResolutionController:
+    """Adjusts the internal render scale to hold a target frame rate.
+
+    observe() takes the time each rendered frame took. After every `window`
+    frames the median is compared with the frame budget: a frame over budget,
+    or one with more than `headroom` to spare, moves the scale towards
+    the estimated scale that fits. Pixel cost grows with the square of the
+    scale, so that estimate is scale * sqrt(budget / time), rounded to `step`
+    and kept within [min_scale, max_scale]. Samples taken at the old scale are
+    dropped after a change.
+    """
+
+    def __init__(self, target_fps=TARGET_FPS, min_scale=MIN_SCALE, max_scale=1.0, step=SCALE_STEP,
+                 window=WINDOW, headroom=0.3):
+        self.target_fps = target_fps
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.step = step
+        self.window = window
+        self.headroom = headroom
+        self.scale = max_scale
+        self._samples = []
+
+    def reset(self, scale=None):
+        self.scale = self.max_scale if scale is None else self._clamp(scale)
+        self._samples = []
+
+    def _clamp(self, scale):
+        scale = round(scale / self.step) * self.step
+        return float(min(max(scale, self.min_scale), self.max_scale))
+
+    def observe(self, seconds):
+        """Record one frame time; returns True when the scale changed."""
+        self._samples.append(seconds)
+        if len(self._samples) < self.window:
+            return False
+        frame_time = float(np.median(self._samples))
+        self._samples = []
+        budget = 1.0 / self.target_fps
+        if budget * (1 - self.headroom) <= frame_time <= budget:
+            return False
+        scale = self._clamp(self.scale * np.sqrt(budget / max(frame_time, 1e-6)))
+        if scale == self.scale:
+            return False
+        print(f"Render scale {self.scale:.3f} -> {scale:.3f} ({1.0 / max(frame_time, 1e-6):.0f} FPS, "
+              f"target {self.target_fps})")
+        self.scale = scale
+        return True
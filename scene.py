@@ -0,0 +1,170 @@
+import numpy as np
+from lod import LODSelector
+from mesh import Mesh
+from pipeline import rotate_y, translate, scale_matrix, linear
+
+
+class Node:
+    """One placement of a mesh in a Scene.
+
+    matrix is the 4x4 model matrix for row vectors (points @ matrix), and
+    color is one RGB color for the whole instance or one per face of the mesh.
+    None uses the mesh's own face colors, or white when it has none.
+    """
+
+    def __init__(self, mesh, matrix=None, color=None):
+        self.mesh = mesh
+        self.matrix = np.eye(4) if matrix is None else np.asarray(matrix, dtype=np.float64)
+        self.color = color
+
+
+class Scene:
+    """Meshes instanced any number of times, merged into the one Mesh the Renderer draws.
+
+    Meshes are mesh.Mesh instances; vertex_normals and edges are merged when
+    every mesh has them. A mesh's arrays are shared by all its nodes. merged() transforms every node of a
+    mesh with one batched matmul, and concatenates the results into a single
+    mesh drawn in one depth-sorted or z-buffered pass. Merged faces, positions
+    and colors are each rebuilt only when the nodes, their matrices, their
+    colors or their LOD levels change, and the merged Mesh with them, so the
+    Renderer's change tracking keeps working.
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self.edges = None  # (E, 2) merged edges when every mesh has them
+        self.face_nodes = None  # Node index of every merged face
+        self._topology_key = self._positions_key = self._colors_key = None
+        self._topology = self._positions = self._normals = self._colors = None
+        self._mesh = None
+        self._selectors = {}  # lod.LODSelector per mesh with lods
+        self._levels = None  # (node, mesh drawn, source faces) of the last merge, keeping morphed meshes alive
+
+    def add(self, mesh, matrix=None, color=None):
+        node = Node(mesh, matrix, color)
+        self.nodes.append(node)
+        return node
+
+    def remove(self, node):
+        self.nodes.remove(node)
+
+    def _levels_drawn(self, camera, height):
+        """(node, mesh, source_faces) for every node: its own mesh, or with a camera the LOD level it calls for.
+
+        source_faces is None when the node draws its mesh at full detail.
+        """
+        levels = []
+        for node in self.nodes:
+            if camera is None or node.mesh.lods is None:
+                levels.append((node, node.mesh, None))
+                continue
+            selector = self._selectors.get(id(node.mesh))
+            if selector is None:
+                selector = self._selectors[id(node.mesh)] = LODSelector(node.mesh)
+            mesh, source_faces = selector.select(camera, height, node.matrix)
+            levels.append((node, mesh, None if mesh is node.mesh else source_faces))
+        return levels
+
+    def _groups(self, levels):
+        """(node, mesh, source_faces) entries grouped by the mesh drawn, in order of first appearance."""
+        groups = {}
+        for level in levels:
+            groups.setdefault(id(level[1]), []).append(level)
+        return list(groups.values())
+
+    def _merge_topology(self, groups):
+        index = {id(node): k for k, node in enumerate(self.nodes)}
+        indices, counts, edges, face_nodes = [], [], [], []
+        base = 0
+        for group in groups:
+            mesh = group[0][1]
+            # Every instance reuses the mesh's faces, shifted to its own block of merged vertices
+            bases = base + len(mesh.positions) * np.arange(len(group), dtype=np.int32)
+            indices.append((mesh.face_indices[None, :] + bases[:, None]).ravel())
+            counts.append(np.tile(np.diff(mesh.face_offsets), len(group)))
+            if mesh.edges is not None:
+                edges.append((mesh.edges[None, :, :] + bases[:, None, None]).reshape(-1, 2))
+            nodes = np.array([index[id(node)] for node, _, _ in group], dtype=np.int32)
+            face_nodes.append(np.repeat(nodes, len(mesh.face_offsets) - 1))
+            base += len(mesh.positions) * len(group)
+        counts = np.concatenate(counts) if counts else np.zeros(0, dtype=np.int32)
+        face_offsets = np.zeros(len(counts) + 1, dtype=np.int32)
+        np.cumsum(counts, out=face_offsets[1:])
+        face_indices = np.concatenate(indices).astype(np.int32) if indices else np.zeros(0, dtype=np.int32)
+        self.edges = np.concatenate(edges).astype(np.int32) if edges and len(edges) == len(groups) else None
+        self.face_nodes = np.concatenate(face_nodes) if face_nodes else np.zeros(0, dtype=np.int32)
+        return face_indices, face_offsets
+
+    def _transform(self, groups, matrices):
+        positions, normals = [], []
+        for group, matrix in zip(groups, matrices):
+            mesh = group[0][1]
+            # (N, 3) @ (K, 3, 3) broadcasts to every instance of the mesh at once
+            positions.append((np.asarray(mesh.positions, dtype=np.float64) @ matrix[:, :3, :3] +
+                              matrix[:, 3:, :3]).reshape(-1, 3))
+            if mesh.vertex_normals is not None:
+                # Normals use the inverse transpose, so scaled instances keep them perpendicular
+                normal_matrix = np.linalg.inv(matrix[:, :3, :3]).transpose(0, 2, 1)
+                normals.append((np.asarray(mesh.vertex_normals, dtype=np.float64) @ normal_matrix).reshape(-1, 3))
+        positions = np.concatenate(positions) if positions else np.zeros((0, 3))
+        normals = np.concatenate(normals) if normals and len(normals) == len(groups) else None
+        return positions, normals
+
+    def merged(self, camera=None, height=None):
+        """Every node in world space as one Mesh with face colors, vertex_normals and edges.
+
+        vertex_normals and edges are None unless every mesh has them. Given the
+        camera and the viewport height in pixels, every node of a mesh with lods
+        is drawn at the level its own size on screen calls for.
+        """
+        levels = self._levels_drawn(camera, height)
+        groups = self._groups(levels)
+        topology_key = tuple((id(group[0][1]), tuple(id(node) for node, _, _ in group)) for group in groups)
+        if topology_key != self._topology_key:
+            self._topology = self._merge_topology(groups)
+            self._topology_key = topology_key
+            self._positions_key = self._colors_key = self._mesh = None
+
+        matrices = [np.stack([node.matrix for node, _, _ in group]) for group in groups]
+        positions_key = b''.join(matrix.tobytes() for matrix in matrices)
+        if positions_key != self._positions_key:
+            self._positions, self._normals = self._transform(groups, matrices)
+            self._positions_key = positions_key
+            self._mesh = None
+
+        colors, counts = [], []
+        for group in groups:
+            for node, mesh, source_faces in group:
+                color = node.color if node.color is not None else node.mesh.colors
+                color = np.asarray(color if color is not None else (255, 255, 255), dtype=np.uint8)
+                # Per-face colors of the full mesh, looked up for the faces of its level
+                colors.append(color[source_faces] if source_faces is not None and color.ndim == 2 else color)
+                counts.append(mesh.face_count)
+        colors_key = tuple(color.tobytes() for color in colors)
+        if colors_key != self._colors_key:
+            colors = [np.broadcast_to(color, (count, 3)) for color, count in zip(colors, counts)]
+            self._colors = np.concatenate(colors) if colors else np.zeros((0, 3), dtype=np.uint8)
+            self._colors_key = colors_key
+            self._mesh = None
+        if self._mesh is None:
+            self._mesh = Mesh(self._positions, *self._topology, colors=self._colors)
+            self._mesh.vertex_normals, self._mesh.edges = self._normals, self.edges
+        self._levels = levels
+        return self._mesh
+
+
+def grid_scene(mesh, count, shrink=True):
+    """A Scene with count instances of a mesh on a square grid, e.g. a parking lot of cars.
+
+    Instances are spaced by the mesh's diameter and turned a little each, and
+    with shrink the whole grid is scaled down to the size of one mesh.
+    """
+    scene = Scene()
+    columns = int(np.ceil(np.sqrt(count)))
+    spacing = 2 * np.linalg.norm(mesh.positions, axis=1).max() if len(mesh.positions) else 1.0
+    scale = scale_matrix(1.0 / columns if shrink else 1.0)
+    for k in range(count):
+        row, column = divmod(k, columns)
+        offset = (np.array([column, 0, row]) - (columns - 1) / 2) * spacing * (1, 0, 1)
+        scene.add(mesh, linear(rotate_y(0.3 * k)) @ translate(offset) @ scale)
+    return scene
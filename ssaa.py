@@ -0,0 +1,133 @@
+import pygame as pg
+import numpy as np
+
+MAX_SSAA_BYTES = 64 * 1024 * 1024  # Upper bound for one supersampled render target
+SSAA_MODES = ('smooth', 'box', 'nearest', 'edge')
+
+
+def box_downsample(color, scale):
+    """Average each scale x scale block of a (W, H, 3) uint8 array."""
+    if scale == 1:
+        return color
+    width, height = color.shape[0] // scale, color.shape[1] // scale
+    color = np.ascontiguousarray(color[:width * scale, :height * scale])
+    # Sum whole rows first, then neighbouring columns, so every add runs over contiguous memory
+    rows = color.reshape(width, scale, height * scale * 3)
+    sums = rows[:, 0].astype(np.uint32 if scale > 16 else np.uint16)
+    for i in range(1, scale):
+        sums += rows[:, i]
+    columns = sums.reshape(width, height, scale, 3)
+    total = columns[:, :, 0] + scale * scale // 2
+    for i in range(1, scale):
+        total += columns[:, :, i]
+    total //= scale * scale
+    return total.astype(np.uint8)
+
+
+def edge_blend(color):
+    """Soften only the pixels that sit on a color discontinuity, in place.
+
+    A cheap post-process alternative to supersampling: pixels whose color
+    differs from a 4-neighbour get the average of their 3x3 neighbourhood,
+    everything else is left untouched.
+    """
+    signal = color.astype(np.int16).sum(axis=2)
+    edges = np.zeros(signal.shape, dtype=bool)
+    edges[1:, :] |= signal[1:, :] != signal[:-1, :]
+    edges[:-1, :] |= signal[:-1, :] != signal[1:, :]
+    edges[:, 1:] |= signal[:, 1:] != signal[:, :-1]
+    edges[:, :-1] |= signal[:, :-1] != signal[:, 1:]
+    edges[[0, -1], :] = edges[:, [0, -1]] = False
+    xs, ys = np.nonzero(edges)
+    if len(xs) == 0:
+        return color
+    total = np.zeros((len(xs), 3), dtype=np.uint16)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            total += color[xs + dx, ys + dy]
+    color[xs, ys] = (total // 9).astype(np.uint8)
+    return color
+
+
+class Supersampler:
+    """Supersampled render target shared by the viewers and the Renderer.
+
+    The high-resolution surface is only allocated when first requested, and the
+    scale is lowered until one target fits in max_bytes. The scale may also be
+    fractional, or below 1 to render under native resolution and upscale, as
+    the ResolutionController does; such targets are resampled with
+    smoothscale except in 'nearest' mode. Modes:
+    'smooth' uses pygame.transform.smoothscale, 'box' averages scale x scale
+    blocks with NumPy (fastest for the z-buffer's color array), 'nearest' is the old pygame.transform.scale,
+    and 'edge' renders at native size and only anti-aliases polygon edges
+    (anti-aliased outlines for drawn polygons, edge_blend for color buffers).
+    """
+
+    def __init__(self, width, height, scale=2, mode='smooth', max_bytes=MAX_SSAA_BYTES):
+        if mode not in SSAA_MODES:
+            raise ValueError(f"Unknown SSAA mode {mode!r}, expected one of {SSAA_MODES}")
+        self.width, self.height = width, height
+        self.scale = scale
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self._surfaces = {}
+
+    def effective_scale(self, bytes_per_pixel=4):
+        """Largest scale <= self.scale whose render target fits in max_bytes."""
+        if self.scale <= 1 or self.mode == 'edge':
+            return min(self.scale, 1)
+        fit = int((self.max_bytes / (self.width * self.height * bytes_per_pixel)) ** 0.5)
+        return max(1, min(self.scale, fit))
+
+    def size(self, bytes_per_pixel=4):
+        scale = self.effective_scale(bytes_per_pixel)
+        return max(1, round(self.width * scale)), max(1, round(self.height * scale))
+
+    def _whole_scale(self, size):
+        """The integer scale of a target size, or None if it is not a whole multiple of native."""
+        scale = size[0] // self.width
+        return scale if scale >= 1 and size == (self.width * scale, self.height * scale) else None
+
+    def _surface(self, size):
+        surface = self._surfaces.get(size)
+        if surface is None:
+            if size != (self.width, self.height):
+                # Only one high-resolution target is kept alive at a time
+                self._surfaces = {key: value for key, value in self._surfaces.items()
+                                  if key == (self.width, self.height)}
+            surface = self._surfaces[size] = pg.Surface(size)
+        return surface
+
+    def target(self):
+        """The supersampled Surface to draw into, allocated on first use."""
+        return self._surface(self.size())
+
+    def output(self):
+        """The reusable native-size Surface resolved frames are written to."""
+        return self._surface((self.width, self.height))
+
+    def resolve(self, surface):
+        """Downsample (or upscale) a render target Surface to native size."""
+        if surface.get_size() == (self.width, self.height):
+            return surface
+        if self.mode == 'nearest':
+            return pg.transform.scale(surface, (self.width, self.height), self.output())
+        if self.mode == 'box' and self._whole_scale(surface.get_size()):
+            return self.resolve_array(pg.surfarray.array3d(surface))
+        return pg.transform.smoothscale(surface, (self.width, self.height), self.output())
+
+    def resolve_array(self, color):
+        """Downsample (or upscale) a (W, H, 3) color array to a native-size Surface."""
+        scale = self._whole_scale(color.shape[:2])
+        if scale == 1:
+            if self.mode == 'edge':
+                color = edge_blend(color.copy())
+        elif self.mode != 'box' or scale is None:
+            high = self._surface(color.shape[:2])
+            pg.surfarray.blit_array(high, color)
+            return self.resolve(high)
+        else:
+            color = box_downsample(color, scale)
+        output = self.output()
+        pg.surfarray.blit_array(output, color)
+        return output
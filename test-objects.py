@@ -1,69 +1,39 @@
 import pygame as pg
 import numpy as np
-from obj_loader import load_obj
+from loading import load_async, box_lines
+from camera import Camera
+from pipeline import transform, to_screen
+from rasterizer import FrameBuffer, draw_lines, draw_points
+from ssaa import Supersampler
+from scene import grid_scene
 
-pg.init()
+CAR_PATH = './objects/car.obj'
 
 WIDTH, HEIGHT = 800, 600
-SSAA_SCALE = 12
-
-high_res_surface = pg.Surface((WIDTH * SSAA_SCALE, HEIGHT * SSAA_SCALE))
-
-screen = pg.display.set_mode((WIDTH, HEIGHT))
-pg.display.set_caption("3D Camera Orbit with Mouse")
+SSAA_SCALE = 12  # Requested scale, lowered by the Supersampler to fit its memory cap
+CAR_COUNT = 6  # Instances of the car in the parking lot
 
 light_pos = np.array([5, 5, 5])
 ambient_light = 0.2
 diffuse_light = 0.8
 
-def rotate_x(angle):
-    cos_angle, sin_angle = np.cos(angle), np.sin(angle)
-    return np.array([
-        [1, 0, 0],
-        [0, cos_angle, -sin_angle],
-        [0, sin_angle, cos_angle]
-    ])
-
-def rotate_y(angle):
-    cos_angle, sin_angle = np.cos(angle), np.sin(angle)
-    return np.array([
-        [cos_angle, 0, sin_angle],
-        [0, 1, 0],
-        [-sin_angle, 0, cos_angle]
-    ])
-
-def project(points, scale=100):
-    return [(int(p[0] * scale) + WIDTH // 2, int(p[1] * scale) + HEIGHT // 2) for p in points]
-
-class Camera:
-    def __init__(self):
-        self.angle_pitch = self.angle_yaw = 0
-        self.distance = 5
-        self.rotation_speed = 0.01
-        self.last_mouse_pos = None
-
-    def control(self):
-        if pg.mouse.get_pressed()[1]:
-            mouse_x, mouse_y = pg.mouse.get_pos()
-            if self.last_mouse_pos:
-                dx, dy = mouse_x - self.last_mouse_pos[0], mouse_y - self.last_mouse_pos[1]
-                self.angle_yaw += dx * self.rotation_speed
-                self.angle_pitch -= dy * self.rotation_speed
-            self.last_mouse_pos = (mouse_x, mouse_y)
-        else:
-            self.last_mouse_pos = None
-
-    def get_position(self):
-        x = self.distance * np.cos(self.angle_pitch) * np.sin(self.angle_yaw)
-        y = self.distance * np.sin(self.angle_pitch)
-        z = self.distance * np.cos(self.angle_pitch) * np.cos(self.angle_yaw)
-        return np.array([x, y, z])
-
 def main():
+    # The window opens here, not on import: the loader's worker processes import this script too
+    pg.init()
+    supersampler = Supersampler(WIDTH, HEIGHT, SSAA_SCALE, mode='box')
+    screen = pg.display.set_mode((WIDTH, HEIGHT))
+    pg.display.set_caption("3D Camera Orbit with Mouse")
+    font = pg.font.SysFont(None, 28)
+
     clock = pg.time.Clock()
     camera = Camera()
+    camera.button = 1  # Orbit with the middle mouse button
 
-    vertices, faces, edges = load_obj('./objects/car.obj')
+    # The car loads in the background and is then instanced; the scene merges all copies into one vertex
+    # and edge array. Until then the window stays live and shows the car's bounding box and vertices so far
+    car = load_async(CAR_PATH)
+    scene = None
+    frame = None
 
     show_rays = False
 
@@ -79,32 +49,44 @@ def main():
 
         camera.control()
 
-        if SSAA_SCALE > 1:
-            high_res_surface.fill((0, 0, 0))
-
-        cam_pos = camera.get_position()
-        translated_vertices = np.array(vertices)
-        rotation_matrix = np.dot(rotate_x(camera.angle_pitch), rotate_y(camera.angle_yaw))
-        rotated_vertices = np.dot(translated_vertices, rotation_matrix)
-        projected_vertices = project(rotated_vertices)
-
-        if SSAA_SCALE > 1:
-            for v in projected_vertices:
-                pg.draw.circle(high_res_surface, (0, 255, 0), (int(v[0] * SSAA_SCALE), int(v[1] * SSAA_SCALE)), 3)
-            for edge in edges:
-                pg.draw.line(high_res_surface, (0, 255, 0), 
-                             (int(projected_vertices[edge[0]][0] * SSAA_SCALE), int(projected_vertices[edge[0]][1] * SSAA_SCALE)),
-                             (int(projected_vertices[edge[1]][0] * SSAA_SCALE), int(projected_vertices[edge[1]][1] * SSAA_SCALE)), 1)
-
-            scaled_surface = pg.transform.scale(high_res_surface, (WIDTH, HEIGHT))
-            screen.blit(scaled_surface, (0, 0))
+        scale = supersampler.effective_scale(FrameBuffer.BYTES_PER_PIXEL)
+        if frame is None or frame.size != (WIDTH * scale, HEIGHT * scale):
+            frame = FrameBuffer(WIDTH * scale, HEIGHT * scale)
+        frame.clear()
+
+        if scene is None and car.done and car.error is None:
+            scene = grid_scene(car.mesh, CAR_COUNT)
+
+        matrix = camera.matrix(WIDTH / HEIGHT)
+        if scene is not None:
+            # Each car is drawn at the LOD level for its own size on screen
+            merged = scene.merged(camera, HEIGHT)
+            vertices, edges = merged.positions, merged.edges
         else:
-            for v in projected_vertices:
-                pg.draw.circle(screen, (0, 255, 0), (int(v[0]), int(v[1])), 3)
-            for edge in edges:
-                pg.draw.line(screen, (0, 255, 0), 
-                             projected_vertices[edge[0]], 
-                             projected_vertices[edge[1]], 1)
+            partial, bounds = car.partial(), car.bounds
+            vertices = partial.positions if partial is not None else np.zeros((0, 3))
+            if bounds is not None:
+                box = transform(box_lines(bounds).reshape(-1, 3), matrix)
+                box_points, _ = to_screen(box, *frame.size)
+                if (box[:, 3] >= camera.near).all():
+                    draw_lines(frame, box_points.reshape(-1, 2, 2), (255, 255, 0))
+        clip = transform(vertices, matrix)
+        projected_vertices, _ = to_screen(clip, *frame.size)
+        in_front = clip[:, 3] >= camera.near
+
+        if scene is not None:
+            # All edges at once as an (E, 2, 2) array of endpoint pixels
+            draw_lines(frame, projected_vertices[edges[in_front[edges].all(axis=1)]], (0, 255, 0))
+        draw_points(frame, projected_vertices[in_front], (0, 255, 0), radius=3)
+        screen.blit(supersampler.resolve_array(frame.color), (0, 0))
+        if scene is None:
+            if car.error is not None:
+                status = f"Failed to load {CAR_PATH}"
+            elif car.progress < 1:
+                status = f"Loading {CAR_PATH}: {int(car.progress * 100)}%"
+            else:
+                status = f"Building edges, BVH and LODs for {CAR_PATH}"
+            screen.blit(font.render(status, True, (255, 255, 255)), (10, 10))
 
         pg.display.flip()
         clock.tick(60)
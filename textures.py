@@ -0,0 +1,210 @@
+import os
+from collections import OrderedDict
+import numpy as np
+import pygame as pg
+from obj_loader import read_mtl
+from rasterizer import rasterize, interpolate
+
+TEXTURE_BUDGET = 64 << 20  # Bytes of texels a TextureCache keeps before evicting
+ATLAS_PADDING = 4  # Texels of wrapped border around every atlas tile, so small mips bleed less
+WHITE = np.full((1, 1, 3), 255, dtype=np.uint8)  # Atlas tile for faces without a texture
+
+
+def downsample(texels):
+    """Half-size level of a (width, height, 3) texel array, averaging 2x2 blocks; odd edges are repeated."""
+    width, height = texels.shape[:2]
+    padded = np.pad(texels, ((0, width % 2), (0, height % 2), (0, 0)), mode='edge').astype(np.uint16)
+    total = padded[0::2, 0::2] + padded[1::2, 0::2] + padded[0::2, 1::2] + padded[1::2, 1::2]
+    return ((total + 2) // 4).astype(np.uint8)
+
+
+class MipChain:
+    """A texture and its box-filtered mip levels, packed level after level into one contiguous array.
+
+    texels is (N, 3) uint8. Level k holds widths[k] x heights[k] texels at
+    texels[offsets[k]:offsets[k + 1]], in surfarray (x, y) order, so one
+    gather samples any mix of levels.
+    """
+
+    def __init__(self, texels):
+        levels = [np.ascontiguousarray(texels, dtype=np.uint8)]
+        while max(levels[-1].shape[:2]) > 1:
+            levels.append(downsample(levels[-1]))
+        self.widths = np.array([level.shape[0] for level in levels], dtype=np.int64)
+        self.heights = np.array([level.shape[1] for level in levels], dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(self.widths * self.heights)))
+        self.texels = np.concatenate([level.reshape(-1, 3) for level in levels])
+
+    @property
+    def count(self):
+        return len(self.widths)
+
+    @property
+    def size(self):
+        return int(self.widths[0]), int(self.heights[0])
+
+    @property
+    def nbytes(self):
+        return self.texels.nbytes
+
+    def level(self, k):
+        """Level k as a (width, height, 3) view."""
+        return self.texels[self.offsets[k]:self.offsets[k + 1]].reshape(self.widths[k], self.heights[k], 3)
+
+    def sample(self, levels, u, v):
+        """Nearest texels at wrapped coordinates (u, v), each from its own mip level."""
+        widths, heights = self.widths[levels], self.heights[levels]
+        tx = (u * widths).astype(np.int64) % widths
+        ty = (v * heights).astype(np.int64) % heights
+        return self.texels[self.offsets[levels] + tx * heights + ty]
+
+
+def mip_levels(xy, uv, size, count):
+    """Mip level of every triangle from the screen-space derivatives of its texture coordinates.
+
+    xy is (T, 3, 2) pixels and uv (T, 3, 2) texture coordinates; size is the
+    (width, height) in texels of level 0, one for all triangles or (T, 2).
+    The texel footprint of a pixel step is constant across a triangle under
+    an affine mapping, so one level covers the whole triangle.
+    """
+    screen = (xy[:, 1:] - xy[:, :1]).transpose(0, 2, 1)
+    texel = ((uv[:, 1:] - uv[:, :1]) * np.reshape(size, (-1, 1, 2))).transpose(0, 2, 1)
+    det = screen[:, 0, 0] * screen[:, 1, 1] - screen[:, 0, 1] * screen[:, 1, 0]
+    degenerate = np.abs(det) < 1e-9
+    screen[degenerate] = np.eye(2)  # Zero-area triangles cover no pixels
+    # Columns of the Jacobian are the texel steps for one pixel along x and along y
+    jacobian = texel @ np.linalg.inv(screen)
+    footprint = np.maximum(np.linalg.norm(jacobian[:, :, 0], axis=1), np.linalg.norm(jacobian[:, :, 1], axis=1))
+    levels = np.floor(np.log2(np.maximum(footprint, 1.0)))
+    levels[degenerate] = 0
+    return np.clip(levels, 0, count - 1).astype(np.int64)
+
+
+def draw_mipmapped_triangles(frame, xy, z, uv, chain, intensities=None, inv_w=None, regions=None):
+    """Rasterize textured triangles from a MipChain, each sampled at the mip level of its on-screen size.
+
+    Arguments are those of rasterizer.draw_textured_triangles, plus regions:
+    optional (T, 4) atlas rectangles (x, y, width, height) in atlas
+    coordinates, inside which each triangle's wrapped coordinates are mapped.
+    """
+    size = np.array(chain.size, dtype=np.float64)
+    if regions is not None:
+        size = regions[:, 2:] * size
+    levels = mip_levels(xy, uv, size, chain.count)
+
+    def shade(ids, weights):
+        u, v = interpolate(weights, uv[ids], None if inv_w is None else inv_w[ids]).T
+        if regions is not None:
+            x, y, width, height = regions[ids].T
+            u, v = x + (u % 1.0) * width, y + (v % 1.0) * height
+        texels = chain.sample(levels[ids], u, v)
+        if intensities is None:
+            return texels
+        return np.clip(texels * intensities[ids, None], 0, 255).astype(np.uint8)
+
+    rasterize(frame, xy, z, shade)
+
+
+class TextureAtlas:
+    """Textures shelf-packed into one image with a shared MipChain.
+
+    regions[k] is texture k's (x, y, width, height) in atlas coordinates.
+    Every tile is surrounded by ATLAS_PADDING texels of its own wrapped
+    edges, so wrapping and the first few mip levels stay clean at the seams.
+    """
+
+    def __init__(self, images, padding=ATLAS_PADDING):
+        sizes = np.array([image.shape[:2] for image in images], dtype=np.int64).reshape(-1, 2) + 2 * padding
+        width = max(int(sizes[:, 0].max(initial=1)), int(np.sqrt((sizes[:, 0] * sizes[:, 1]).sum())))
+        width = 1 << (width - 1).bit_length()
+        # Tallest first, filling rows left to right
+        positions = np.zeros_like(sizes)
+        x = y = row_height = 0
+        for k in np.argsort(-sizes[:, 1], kind='stable'):
+            if x + sizes[k, 0] > width:
+                x, y, row_height = 0, y + row_height, 0
+            positions[k] = x, y
+            x += sizes[k, 0]
+            row_height = max(row_height, sizes[k, 1])
+        height = max(y + row_height, 1)
+
+        atlas = np.zeros((width, height, 3), dtype=np.uint8)
+        for image, (x, y), (w, h) in zip(images, positions.tolist(), sizes.tolist()):
+            atlas[x:x + w, y:y + h] = np.pad(image, ((padding, padding), (padding, padding), (0, 0)), mode='wrap')
+        self.chain = MipChain(atlas)
+        self.regions = np.column_stack([(positions + padding) / (width, height),
+                                        (sizes - 2 * padding) / (width, height)])
+
+    @property
+    def nbytes(self):
+        return self.chain.nbytes
+
+
+class TextureCache:
+    """Loads each image once as a MipChain and keeps the most recently used ones within `budget` bytes.
+
+    Atlases are cached the same way, keyed by the files they pack. The entry
+    just requested is never evicted, even when it alone exceeds the budget.
+    """
+
+    def __init__(self, budget=TEXTURE_BUDGET):
+        self.budget = budget
+        self.used = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, path):
+        """The MipChain of an image file, loaded on first use."""
+        key = os.path.abspath(path)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        chain = MipChain(pg.surfarray.array3d(pg.image.load(path)))
+        self._store(key, chain)
+        return chain
+
+    def atlas(self, paths):
+        """A TextureAtlas of the image files, with a white tile for untextured faces appended last."""
+        key = ('atlas',) + tuple(os.path.abspath(path) for path in paths)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        atlas = TextureAtlas([self.get(path).level(0) for path in paths] + [WHITE])
+        self._store(key, atlas)
+        return atlas
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self.used += entry.nbytes
+        while self.used > self.budget and len(self._entries) > 1:
+            evicted, old = self._entries.popitem(last=False)
+            self.used -= old.nbytes
+            print(f"Evicted texture {evicted} ({old.nbytes / 1e6:.1f} MB), {self.used / 1e6:.1f} MB cached")
+
+
+def material_atlas(cache, mesh, directory='.'):
+    """Atlas of the diffuse maps (map_Kd) of a mesh's MTL materials, and the (F, 4) atlas region of every face.
+
+    Material libraries are looked up in directory. Faces whose material has
+    no readable texture, or none at all, get the atlas's white tile.
+    """
+    maps = {}
+    for library in mesh.mtllibs:
+        path = os.path.join(directory, library)
+        try:
+            materials = read_mtl(path)
+        except OSError as e:
+            print(f"Could not read material library {path}: {e}")
+            continue
+        for name, material in materials.items():
+            if 'map_Kd' in material:
+                maps[name] = os.path.join(os.path.dirname(path), material['map_Kd'])
+    paths = sorted({path for path in maps.values() if os.path.exists(path)})
+    atlas = cache.atlas(paths)
+    tiles = np.full(mesh.face_count, len(paths), dtype=np.int64)
+    for face_start, face_end, _, _, material in mesh.groups:
+        if maps.get(material) in paths:
+            tiles[face_start:face_end] = paths.index(maps[material])
+    return atlas, atlas.regions[tiles]
@@ -0,0 +1,103 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from rasterizer import FrameBuffer, rasterize
+
+TILE_SIZE = 128  # Tile edge in pixels; small enough to balance work across workers
+
+
+def bin_triangles(xy, width, height, tile_size=TILE_SIZE):
+    """Sort screen-space triangles into the tiles their bounding boxes overlap.
+
+    Returns (tile ids, triangle ids, offsets): triangle ids grouped by tile in
+    ascending tile order, with offsets[k]:offsets[k + 1] spanning the group of
+    tile_ids[k]. Tiles are numbered row by row across a grid of tile columns.
+    """
+    columns = -(-width // tile_size)
+    rows = -(-height // tile_size)
+    x, y = xy[..., 0], xy[..., 1]
+    tx0 = np.clip(np.floor(x.min(axis=1) / tile_size), 0, columns - 1).astype(np.int64)
+    tx1 = np.clip(np.floor(x.max(axis=1) / tile_size), 0, columns - 1).astype(np.int64)
+    ty0 = np.clip(np.floor(y.min(axis=1) / tile_size), 0, rows - 1).astype(np.int64)
+    ty1 = np.clip(np.floor(y.max(axis=1) / tile_size), 0, rows - 1).astype(np.int64)
+    on_screen = (x.max(axis=1) >= 0) & (x.min(axis=1) < width) & (y.max(axis=1) >= 0) & (y.min(axis=1) < height)
+
+    tris = np.flatnonzero(on_screen)
+    spans_x = tx1[tris] - tx0[tris] + 1
+    counts = spans_x * (ty1[tris] - ty0[tris] + 1)
+    tri_ids = np.repeat(tris, counts)
+    local = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    spans_x = np.repeat(spans_x, counts)
+    tiles = (ty0[tri_ids] + local // spans_x) * columns + tx0[tri_ids] + local % spans_x
+
+    # A stable sort keeps triangles in submission order inside every tile
+    order = np.argsort(tiles, kind='stable')
+    tiles, tri_ids = tiles[order], tri_ids[order]
+    tile_ids, starts = np.unique(tiles, return_index=True)
+    offsets = np.append(starts, len(tiles))
+    return tile_ids, tri_ids, offsets
+
+
+class TiledRasterizer:
+    """Rasterizes a frame as independent screen tiles on a pool of worker threads.
+
+    Each tile renders into its own small FrameBuffer, so workers never share
+    memory while the NumPy kernels run with the GIL released, and the finished
+    tiles are copied back into the frame. workers=None uses every CPU core.
+    """
+
+    def __init__(self, workers=None, tile_size=TILE_SIZE):
+        self.workers = workers or os.cpu_count() or 1
+        self.tile_size = tile_size
+        self._pool = ThreadPoolExecutor(self.workers) if self.workers > 1 else None
+        self._tiles = {}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _tile(self, width, height):
+        key = (width, height)
+        if key not in self._tiles:
+            self._tiles[key] = [FrameBuffer(width, height) for _ in range(self.workers)]
+        return self._tiles[key]
+
+    def rasterize(self, frame, xy, z, shade):
+        """Same contract as rasterizer.rasterize, split across screen tiles."""
+        xy = np.asarray(xy, dtype=np.float64)
+        size = self.tile_size
+        columns = -(-frame.width // size)
+        z = np.asarray(z)
+        tile_ids, tri_ids, offsets = bin_triangles(xy, frame.width, frame.height, size)
+        # Allocate the per-worker buffers up front so workers only ever read the cache
+        for width in {size, frame.width - (columns - 1) * size}:
+            for height in {size, frame.height - (frame.height - 1) // size * size}:
+                self._tile(width, height)
+
+        def render(worker):
+            for k in range(worker, len(tile_ids), self.workers):
+                x0, y0 = tile_ids[k] % columns * size, tile_ids[k] // columns * size
+                x1, y1 = min(x0 + size, frame.width), min(y0 + size, frame.height)
+                region = (slice(x0, x1), slice(y0, y1))
+                # Tiles on the right and bottom edges may be smaller than tile_size
+                target = self._tile(x1 - x0, y1 - y0)[worker]
+                target.color[...] = frame.color[region]
+                target.depth[...] = frame.depth[region]
+                tris = tri_ids[offsets[k]:offsets[k + 1]]
+                rasterize(target, xy[tris] - (x0, y0), z[tris],
+                          lambda ids, weights: shade(tris[ids], weights))
+                frame.color[region] = target.color
+                frame.depth[region] = target.depth
+
+        if self._pool is None:
+            render(0)
+        else:
+            for future in [self._pool.submit(render, worker) for worker in range(self.workers)]:
+                future.result()
+
+
+def draw_triangles_tiled(tiler, frame, xy, z, colors):
+    """Tiled counterpart of rasterizer.draw_triangles."""
+    colors = np.asarray(colors, dtype=np.uint8)
+    tiler.rasterize(frame, xy, z, lambda ids, weights: np.take(colors, ids, axis=0))
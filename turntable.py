@@ -0,0 +1,172 @@
+"""Offline batch renderer for turntables and camera paths.
+
+Renders a mesh headlessly with the viewer's Renderer along a camera path and
+writes numbered PNGs, or pipes raw RGB frames to an encoder. Frames are split
+across a multiprocessing pool; every worker loads the mesh once through the
+cached loader. Examples:
+
+    python turntable.py ./objects/car.obj --frames 120 --resolution 1280x720 --ssaa 2 --output-dir frames
+    python turntable.py ./objects/car.obj --key 0 0 0.3 1 --key 60 3.14 0.6 1.5 --key 120 6.28 0.3 1 \\
+        --pipe "ffmpeg -y -f rawvideo -pix_fmt rgb24 -s 1280x720 -r 30 -i - car.mp4"
+
+Keyframes give angle_yaw, angle_pitch and scale_factor (the Camera fields)
+at a frame number, and are interpolated linearly in between. Without any,
+the camera makes one full turn around the mesh over --frames.
+"""
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse
+import multiprocessing
+import shlex
+import subprocess
+import time
+import numpy as np
+import pygame as pg
+from benchmark import parse_resolution
+from bvh import BVH
+from camera import Camera
+from obj_loader import load_mesh
+from pipeline import vertex_normals, SHADING_MODES
+from primitives import cube
+from renderer import Renderer
+from ssaa import SSAA_MODES
+
+PATH_FIELDS = ('angle_yaw', 'angle_pitch', 'scale_factor')  # Camera fields a keyframe sets
+
+
+class CameraPath:
+    """Camera poses interpolated linearly between (frame, yaw, pitch, scale) keyframes."""
+
+    def __init__(self, keyframes):
+        keyframes = np.array(sorted(keyframes), dtype=np.float64).reshape(-1, 1 + len(PATH_FIELDS))
+        if len(keyframes) == 0:
+            raise ValueError("A camera path needs at least one keyframe")
+        self.frames = keyframes[:, 0]
+        self.values = keyframes[:, 1:]
+
+    @classmethod
+    def turntable(cls, frames, pitch=0.4, scale=1.0):
+        """One full turn in `frames` steps; the end pose equals frame 0, so the sequence loops."""
+        return cls([(0, 0.0, pitch, scale), (frames, 2 * np.pi, pitch, scale)])
+
+    def pose(self, frame):
+        return {name: float(np.interp(frame, self.frames, self.values[:, k])) for k, name in enumerate(PATH_FIELDS)}
+
+    def apply(self, camera, frame):
+        for name, value in self.pose(frame).items():
+            setattr(camera, name, value)
+
+
+def load(name):
+    """The mesh to render, with its BVH and vertex normals; 'cube' is the viewer's cube."""
+    if name == 'cube':
+        mesh = cube()
+        mesh.bvh = BVH.build(mesh.positions, mesh.face_indices, mesh.face_offsets)
+        mesh.vertex_normals = vertex_normals(mesh.positions, mesh.face_indices, mesh.face_offsets)
+    else:
+        mesh = load_mesh(name)
+    if mesh.colors is None:
+        mesh.colors = np.full((mesh.face_count, 3), 255, dtype=np.uint8)
+    return mesh
+
+
+_worker = None  # (mesh, renderer, camera, path, options) of this pool process
+
+
+def _init_worker(mesh_name, width, height, ssaa, options, path):
+    global _worker
+    mesh = load(mesh_name)
+    renderer = Renderer(width, height, ssaa_scale=ssaa, ssaa_mode=options['ssaa_mode'])
+    renderer.ssaa_enabled = ssaa > 1
+    renderer.zbuffer_enabled = options['mode'] == 'zbuffer'
+    renderer.shading = options['shading']
+    renderer.shadows_enabled = options['shadows']
+    renderer.lod_enabled = options['lod']
+    _worker = (mesh, renderer, Camera(), path, options)
+
+
+def _render_frame(frame):
+    """Render one frame; returns its raw RGB bytes when piping, else writes the PNG and returns None."""
+    mesh, renderer, camera, path, options = _worker
+    path.apply(camera, frame)
+    surface = renderer.render(mesh, camera)
+    if options['output_dir'] is None:
+        return pg.image.tobytes(surface, 'RGB')
+    pg.image.save(surface, os.path.join(options['output_dir'], options['pattern'] % frame))
+    return None
+
+
+def render_sequence(mesh_name, path, frames, width, height, ssaa=1, processes=None, output_dir='frames',
+                    pattern='frame_%04d.png', pipe=None, mode='zbuffer', shading=SHADING_MODES[0],
+                    ssaa_mode=SSAA_MODES[0], shadows=False, lod=False, chunksize=4):
+    """Render frames 0 .. frames - 1 of path on a process pool and return the frames per second.
+
+    Frames go to output_dir as numbered PNGs, or with pipe (a shell command)
+    to the command's stdin as raw rgb24 frames in order. With lod, every frame
+    draws the mesh's LOD level for its size on screen.
+    """
+    processes = processes or os.cpu_count() or 1
+    # Build the compiled mesh cache once here, so the workers all just read it
+    load(mesh_name)
+    options = {'mode': mode, 'shading': shading, 'ssaa_mode': ssaa_mode, 'shadows': shadows, 'lod': lod,
+               'output_dir': None if pipe else output_dir, 'pattern': pattern}
+    if not pipe:
+        os.makedirs(output_dir, exist_ok=True)
+    encoder = subprocess.Popen(shlex.split(pipe), stdin=subprocess.PIPE) if pipe else None
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes, _init_worker, (mesh_name, width, height, ssaa, options, path)) as pool:
+        # imap keeps frame order, which the encoder pipe relies on
+        for frame, data in enumerate(pool.imap(_render_frame, range(frames), chunksize)):
+            if encoder is not None:
+                encoder.stdin.write(data)
+            if (frame + 1) % 10 == 0 or frame + 1 == frames:
+                print(f"\rRendered {frame + 1}/{frames} frames", end='', flush=True)
+    elapsed = time.perf_counter() - start
+    print()
+    if encoder is not None:
+        encoder.stdin.close()
+        encoder.wait()
+    return frames / elapsed if elapsed > 0 else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a mesh along a camera path to an image sequence")
+    parser.add_argument('mesh', help="OBJ file, or 'cube'")
+    parser.add_argument('--frames', type=int, help="defaults to 120, or up to the last keyframe")
+    parser.add_argument('--key', nargs=4, type=float, action='append', metavar=('FRAME', 'YAW', 'PITCH', 'SCALE'),
+                        help="camera keyframe; repeat for a path, default is a full turntable")
+    parser.add_argument('--pitch', type=float, default=0.4, help="turntable pitch in radians")
+    parser.add_argument('--scale', type=float, default=1.0, help="turntable camera scale_factor")
+    parser.add_argument('--resolution', type=parse_resolution, default=(800, 600))
+    parser.add_argument('--ssaa', type=int, default=1)
+    parser.add_argument('--ssaa-mode', choices=SSAA_MODES, default=SSAA_MODES[0])
+    parser.add_argument('--mode', choices=['painter', 'zbuffer'], default='zbuffer')
+    parser.add_argument('--shading', choices=SHADING_MODES, default=SHADING_MODES[0])
+    parser.add_argument('--shadows', action='store_true', help="cast BVH shadow rays from the light")
+    parser.add_argument('--lod', action='store_true', help="draw the LOD level picked for the mesh's size on screen")
+    parser.add_argument('--processes', type=int, help="pool size, defaults to the CPU count")
+    parser.add_argument('--output-dir', default='frames')
+    parser.add_argument('--pattern', default='frame_%04d.png', help="PNG file name, with the frame number")
+    parser.add_argument('--pipe', help="encoder command reading raw rgb24 frames on stdin, instead of PNGs")
+    args = parser.parse_args()
+
+    if args.key:
+        path = CameraPath(args.key)
+        args.frames = args.frames or int(path.frames[-1]) + 1
+    else:
+        args.frames = args.frames or 120
+        path = CameraPath.turntable(args.frames, args.pitch, args.scale)
+    width, height = args.resolution
+    processes = args.processes or os.cpu_count() or 1
+    fps = render_sequence(args.mesh, path, args.frames, width, height, args.ssaa, processes, args.output_dir,
+                          args.pattern, args.pipe, args.mode, args.shading, args.ssaa_mode, args.shadows,
+                          args.lod)
+    target = args.pipe if args.pipe else os.path.join(args.output_dir, args.pattern)
+    print(f"{args.frames} frames at {width}x{height} ssaa={args.ssaa} to {target}: "
+          f"{fps:.2f} frames/s on {processes} processes")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
 import dearpygui.dearpygui as dpg
+from ssaa import SSAA_MODES
+from pipeline import SHADING_MODES
 
-def create_ui(width, height, button_callback, color_callbacks, face_colors, toggle_raycasting, toggle_lighting, toggle_ssaa, toggle_rainbow_mode):
+def create_ui(width, height, button_callback, color_callbacks, face_colors, toggle_raycasting, toggle_lighting, toggle_ssaa, toggle_rainbow_mode,
+              toggle_zbuffer=None, toggle_culling=None, toggle_profiler=None, set_ssaa_mode=None, toggle_shadows=None,
+              set_shading=None, toggle_adaptive=None, set_target_fps=None, target_fps=60, toggle_lod=None,
+              toggle_tiles=None):
     dpg.create_context()
 
     def resize_ui(sender, app_data):
@@ -31,8 +36,28 @@ def create_ui(width, height, button_callback, color_callbacks, face_colors, togg
 
             dpg.add_checkbox(label="Show Raycasting Lines", callback=toggle_raycasting)
             dpg.add_checkbox(label="Enable Lighting", callback=toggle_lighting, default_value=True)
+            if set_shading is not None:
+                dpg.add_combo(list(SHADING_MODES), label="Shading", callback=set_shading, tag="shading_combo", default_value=SHADING_MODES[0])
             dpg.add_checkbox(label="Enable SSAA", callback=toggle_ssaa, tag="ssaa_checkbox", default_value=False)
+            if set_ssaa_mode is not None:
+                dpg.add_combo(list(SSAA_MODES), label="SSAA Mode", callback=set_ssaa_mode, tag="ssaa_mode_combo", default_value=SSAA_MODES[0])
+            if toggle_adaptive is not None:
+                dpg.add_checkbox(label="Adaptive Resolution", callback=toggle_adaptive, tag="adaptive_checkbox", default_value=False)
+                dpg.add_slider_int(label="Target FPS", callback=set_target_fps, tag="target_fps_slider", default_value=target_fps, min_value=15, max_value=60)
+                dpg.add_text("Render scale: 1.00", tag="render_scale_text")
             dpg.add_checkbox(label="Enable Rainbow Mode", callback=toggle_rainbow_mode, tag="rainbow_mode_checkbox", default_value=False)
+            if toggle_zbuffer is not None:
+                dpg.add_checkbox(label="Use Z-Buffer", callback=toggle_zbuffer, tag="zbuffer_checkbox", default_value=False)
+            if toggle_tiles is not None:
+                dpg.add_checkbox(label="Tiled Rasterizer", callback=toggle_tiles, tag="tiles_checkbox", default_value=True)
+            if toggle_culling is not None:
+                dpg.add_checkbox(label="Enable Culling", callback=toggle_culling, tag="culling_checkbox", default_value=True)
+            if toggle_shadows is not None:
+                dpg.add_checkbox(label="Enable Shadows", callback=toggle_shadows, tag="shadows_checkbox", default_value=False)
+            if toggle_lod is not None:
+                dpg.add_checkbox(label="Level of Detail", callback=toggle_lod, tag="lod_checkbox", default_value=True)
+            if toggle_profiler is not None:
+                dpg.add_checkbox(label="Show Profiler", callback=toggle_profiler, tag="profiler_checkbox", default_value=False)
 
     dpg.create_viewport(title='3D Cube Viewer', width=width, height=height, resizable=True)
     dpg.setup_dearpygui()